@@ -1,62 +1,106 @@
+import datetime
 import os
 
-import aiohttp
-from discord.ext.commands import Bot
 from dotenv import load_dotenv
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
 
 from dateutil import parser
-from shared.error_reporter import send_error_message
-from database.db import db_session_scope
+from apis.http_client import http_request
+from database.db import run_in_db_session
 from database.models.free_game import FreeGame, GameType
 from shared.exceptions import ApiException
+from shared.logger import log
 
 load_dotenv()
 
 ITAD_API_KEY = os.getenv("ITAD_API_KEY")
 ITAD_DEALS_ENDPOINT = "https://api.isthereanydeal.com/deals/v2"
 
+# The maximum amount of deals ITAD returns per page
+ITAD_PAGE_SIZE = 200
+# Stops paging if the results never run out, for example when the filter stops working
+ITAD_MAX_PAGES = 20
 
-async def get_free_to_keep_games(bot: Bot) -> list[FreeGame]:
+
+async def get_free_to_keep_deals() -> tuple[list[dict], bool]:
+    """
+    Retrieves all pages of free-to-keep deals.
+    Returns the deals, and whether all of them could be retrieved.
+    """
     params = {
         "key": ITAD_API_KEY,
         "filter": "N4IgDgTglgxgpiAXKAtlAdk9BXANrgGhBQEMAPJABgF9qg",     # Only free games (up to 0 euro)
         "mature": "true",
         "country": "NL",
+        "limit": ITAD_PAGE_SIZE,
+        "offset": 0,
     }
 
-    async with aiohttp.ClientSession() as session:
-        response = await session.get(ITAD_DEALS_ENDPOINT, params=params)
-        response_body = await response.text()
+    game_deals = []
+    for _ in range(ITAD_MAX_PAGES):
+        response = await http_request("GET", ITAD_DEALS_ENDPOINT, params=params)
         try:
             response.raise_for_status()
         except Exception as e:
-            raise ApiException(f"Failed to get free-to-keep games. {response_body} {e}", e)
-
-        payload = await response.json()
-        if payload["hasMore"] is True:
-            await send_error_message(bot, "Warning: not all free-to-keep games fit in the response.")
-
-    with db_session_scope() as db_session:
-        # Empty the free games table
-        db_session.query(FreeGame).delete()
-
-        free_games = []
-        game_deals_list = payload["list"]
-        for game_deal in game_deals_list:
-            deal_info = game_deal["deal"]
-            expiry_datetime = parser.isoparse(deal_info["expiry"]) if deal_info["expiry"] else None
-            game_type = GameType(game_deal["type"]) if game_deal["type"] else None
-            # Save info on this deal in a new FreeGameData object
-            free_game = FreeGame(
-                deal_id=game_deal["id"],
-                game_name=game_deal["title"],
-                shop_name=deal_info["shop"]["name"],
-                expiry_datetime=expiry_datetime,
-                url=deal_info["url"],
-                type=game_type,
+            raise ApiException(f"Failed to get free-to-keep games. {response.text()} {e}", e)
+
+        payload = response.json()
+        game_deals.extend(payload["list"])
+        if payload["hasMore"] is not True:
+            return game_deals, True
+        params["offset"] = payload["nextOffset"]
+
+    log(f"Stopped retrieving free-to-keep games after {ITAD_MAX_PAGES} pages")
+    return game_deals, False
+
+
+async def update_free_to_keep_games() -> set[str]:
+    """
+    Saves the current free-to-keep deals, and deletes the ones that have expired or are no longer listed.
+    Returns the IDs of the deals that were not saved before.
+    """
+    game_deals, complete = await get_free_to_keep_deals()
+
+    free_games = {}     # type: dict[str, dict]
+    for game_deal in game_deals:
+        deal_info = game_deal["deal"]
+        # Saved in UTC, as the time zone is not stored
+        expiry_datetime = parser.isoparse(deal_info["expiry"]).astimezone(datetime.timezone.utc) if deal_info["expiry"] else None
+        game_type = GameType(game_deal["type"]) if game_deal["type"] else None
+        free_games[game_deal["id"]] = {
+            "deal_id": game_deal["id"],
+            "game_name": game_deal["title"],
+            "shop_name": deal_info["shop"]["name"],
+            "expiry_datetime": expiry_datetime,
+            "url": deal_info["url"],
+            "type": game_type,
+        }
+
+    def save(db_session: Session) -> set[str]:
+        existing_deals = (
+            db_session.query(FreeGame.deal_id)
+                .filter(FreeGame.deal_id.in_(free_games.keys()))
+                .all()
+        )
+        existing_deal_ids = set(deal_id for deal_id, in existing_deals)
+
+        if len(free_games) > 0:
+            statement = insert(FreeGame).values(list(free_games.values()))
+            statement = statement.on_conflict_do_update(
+                index_elements=[FreeGame.deal_id],
+                set_={column: statement.excluded[column] for column in ["game_name", "shop_name", "expiry_datetime", "url", "type"]},
             )
+            db_session.execute(statement)
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        removed_condition = FreeGame.expiry_datetime < now
+        # Deals that are no longer listed have ended, but only a complete listing shows which ones those are
+        if complete:
+            removed_condition = or_(removed_condition, FreeGame.deal_id.not_in(free_games.keys()))
+        db_session.execute(delete(FreeGame).where(removed_condition))
 
-            free_games.append(free_game)
-            db_session.add(free_game)
+        return set(free_games.keys()) - existing_deal_ids
 
-    return free_games
+    return await run_in_db_session(save)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+from typing import Optional, Any
+
+import aiohttp
+from yarl import URL
+
+from apis.resilience import get_api_guard
+from shared.exceptions import ApiException
+from shared.logger import log
+from shared.rate_limiter import TokenBucket
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5)
+HTTP_CONNECTION_LIMIT = 100
+HTTP_CONNECTION_LIMIT_PER_HOST = 10
+HTTP_DNS_CACHE_TTL = 5 * 60         # Seconds
+HTTP_KEEPALIVE_TIMEOUT = 60         # Seconds an idle connection is kept open for reuse
+
+HTTP_REQUEST_ATTEMPTS = 3
+HTTP_RETRY_DELAY = 1    # Seconds, doubled after every failed attempt
+HTTP_MAX_RETRY_DELAY = 30
+# Status codes that are worth retrying, as they are caused by rate limits or temporary outages
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None     # type: Optional[aiohttp.ClientSession]
+
+
+class HttpResponse:
+    """
+    A fully read response, so its connection can go back to the pool right away.
+    """
+
+    def __init__(self, url: str, status: int, reason: str, headers: dict, body: bytes) -> None:
+        super().__init__()
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise ApiException(f"{self.status} {self.reason} for {self.url}")
+
+
+async def start_http_session() -> None:
+    """
+    Creates the HTTP session shared by all APIs. Gets called when the bot starts.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+
+
+async def close_http_session() -> None:
+    """
+    Closes the shared HTTP session and its pooled connections. Gets called when the bot shuts down.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    # Start the session on first use, for when the APIs are used outside the bot
+    if _session is None or _session.closed:
+        await start_http_session()
+    return _session
+
+
+async def http_request(method: str, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                       data: Any = None, timeout: Optional[aiohttp.ClientTimeout] = None,
+                       rate_limiter: Optional[TokenBucket] = None, attempts: int = HTTP_REQUEST_ATTEMPTS) -> HttpResponse:
+    """
+    Sends a request using the shared HTTP session, retrying with exponential backoff on connection errors, timeouts and
+    temporary error statuses. Each attempt first waits for the rate limiter, if given.
+    Returns the last response, which can still have an error status.
+    Raises an ApiUnavailableException without sending anything if the host keeps failing or used up its request budget,
+    and an ApiException if no attempt got a response.
+    """
+    session = await get_http_session()
+    api_guard = get_api_guard(URL(url).host)
+    delay = HTTP_RETRY_DELAY
+    response = None
+    error = None
+    for attempt in range(1, attempts + 1):
+        api_guard.check_request()
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+
+        failed = None
+        start = time.monotonic()
+        try:
+            # Waiting for a free slot does not count towards the latency
+            async with api_guard.semaphore:
+                start = time.monotonic()
+                async with session.request(method, url, params=params, headers=headers, data=data, timeout=timeout or HTTP_TIMEOUT) as http_response:
+                    # Leave out the query, as it can contain API keys
+                    response = HttpResponse(str(http_response.url.with_query(None)), http_response.status, http_response.reason, dict(http_response.headers), await http_response.read())
+            failed = response.status in RETRY_STATUS_CODES
+            if not failed:
+                return response
+            log(f"{method} {url} returned {response.status} (attempt {attempt}/{attempts})")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed = True
+            error = e
+            log(f"{method} {url} failed (attempt {attempt}/{attempts}): {e!r}")
+        finally:
+            if failed is None:
+                api_guard.record_cancelled()
+            else:
+                api_guard.record_response(time.monotonic() - start, failed)
+
+        # Retrying is pointless once the host is considered down
+        if attempt < attempts and not api_guard.circuit_breaker.is_open:
+            await asyncio.sleep(_get_retry_delay(response, delay))
+            delay = min(delay * 2, HTTP_MAX_RETRY_DELAY)
+        elif attempt < attempts:
+            break
+
+    if response is None:
+        raise ApiException(f"{method} {url} failed after {attempts} attempts: {error!r}")
+    return response
+
+
+def _get_retry_delay(response: Optional[HttpResponse], delay: float) -> float:
+    # Respect how long a rate limited API asks us to wait
+    if response is not None and response.status == 429:
+        try:
+            return min(float(response.headers.get("Retry-After", delay)), HTTP_MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    return delay
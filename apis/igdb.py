@@ -1,13 +1,22 @@
+import asyncio
 import os
+import time
 from typing import Optional
 
-import aiohttp
 from discord.ext.commands import Bot
 
 from dotenv import load_dotenv
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
 
+from apis.http_client import http_request
+from apis.igdb_cache import load_igdb_games, save_igdb_games, normalize_game_name
+from database.db import run_in_db_session
+from database.models import Game
 from shared.error_reporter import send_error_message
 from shared.exceptions import ApiException
+from shared.logger import log
+from shared.rate_limiter import TokenBucket
 
 load_dotenv()
 
@@ -17,7 +26,18 @@ TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
 
 TWITCH_TOKEN_ENDPOINT = "https://id.twitch.tv/oauth2/token"
 IGDB_GAMES_ENDPOINT = "https://api.igdb.com/v4/games"
-IGDB_MULTIPLAYER_MODES_ENDPOINT = "https://api.igdb.com/v4/multiplayer_modes"
+IGDB_MULTIQUERY_ENDPOINT = "https://api.igdb.com/v4/multiquery"
+
+# IGDB allows 4 requests per second
+IGDB_RATE_LIMITER = TokenBucket(rate=4, capacity=4)
+# Amount of searches that can be combined into one multiquery request
+IGDB_MULTIQUERY_SIZE = 10
+MULTIPLAYER_COMMIT_BATCH_SIZE = 100
+NO_COOP_CAMPAIGN_NOTE = "No co-op campaign."
+
+# Get a new access token this many seconds before the current one expires
+ACCESS_TOKEN_EXPIRY_MARGIN = 60
+MULTIPLAYER_MODE_FIELDS = ["campaigncoop", "offlinecoop", "offlinecoopmax", "offlinemax", "onlinecoopmax", "onlinemax"]
 
 
 class MultiplayerInfo:
@@ -52,87 +72,221 @@ class MultiplayerInfo:
 
 class IgdbApi:
 
-    def __init__(self, session: aiohttp.ClientSession) -> None:
+    def __init__(self) -> None:
         super().__init__()
         self.headers = {}
-        self.session = session
+        self.access_token_expiry = 0.0
+        self._authenticate_lock = asyncio.Lock()
+
+    async def authenticate(self, force=False):
+        """
+        Gets a Twitch access token, unless the previous one is still valid.
+        """
+        async with self._authenticate_lock:
+            if not force and time.time() < self.access_token_expiry - ACCESS_TOKEN_EXPIRY_MARGIN:
+                return
+
+            params = {
+                "client_id": TWITCH_CLIENT_ID,
+                "client_secret": TWITCH_CLIENT_SECRET,
+                "grant_type": "client_credentials",
+            }
+
+            response = await http_request("POST", TWITCH_TOKEN_ENDPOINT, params=params)
+            try:
+                response.raise_for_status()
+            except Exception as e:
+                raise ApiException(f"Failed to get Twitch access token. {response.text()} {e}", e)
+
+            payload = response.json()
+            access_token = payload.get("access_token")
+
+            self.headers = {
+                "Client-ID": TWITCH_CLIENT_ID,
+                "Authorization": f"Bearer {access_token}",
+            }
+            self.access_token_expiry = time.time() + payload.get("expires_in", 0)
+
+    async def query(self, endpoint: str, body: str) -> list[dict]:
+        await self.authenticate()
+        response = await http_request("POST", endpoint, headers=self.headers, data=body, rate_limiter=IGDB_RATE_LIMITER)
+        if response.status == 401:
+            # The access token was revoked before it expired, so get a new one
+            await self.authenticate(force=True)
+            response = await http_request("POST", endpoint, headers=self.headers, data=body, rate_limiter=IGDB_RATE_LIMITER)
+
+        response.raise_for_status()
+        return response.json()
+
+    async def get_game(self, game_name: str) -> dict:
+        """
+        Searches for the given game, including its multiplayer modes.
+        """
+        try:
+            games = await self.query(IGDB_GAMES_ENDPOINT, get_search_query(game_name))
+        except ApiException as e:
+            raise ApiException(f"Failed to get game from IGDB. {e}", e)
 
-    async def authenticate(self):
-        params = {
-            "client_id": TWITCH_CLIENT_ID,
-            "client_secret": TWITCH_CLIENT_SECRET,
-            "grant_type": "client_credentials",
-        }
+        return pick_game(games, game_name)
 
-        response = await self.session.post(TWITCH_TOKEN_ENDPOINT, params=params)
-        response_body = await response.text()
+    async def get_games(self, game_names: list[str]) -> dict[str, dict]:
+        """
+        Searches for up to 10 games in a single multiquery request, returning the found game by each name.
+        """
+        queries = []
+        for index, game_name in enumerate(game_names):
+            queries.append(f'query games "{index}" {{ {get_search_query(game_name)} }};')
         try:
-            response.raise_for_status()
-        except Exception as e:
-            raise ApiException(f"Failed to get Twitch access token. {response_body} {e}", e)
+            results = await self.query(IGDB_MULTIQUERY_ENDPOINT, "\n".join(queries))
+        except ApiException as e:
+            raise ApiException(f"Failed to get games from IGDB. {e}", e)
 
-        payload = await response.json()
-        access_token = payload.get("access_token")
+        games_by_name = {}
+        for result in results:
+            game_name = game_names[int(result["name"])]
+            games_by_name[game_name] = pick_game(result.get("result", []), game_name)
+        return games_by_name
 
-        self.headers = {
-            "Client-ID": TWITCH_CLIENT_ID,
-            "Authorization": f"Bearer {access_token}",
-        }
 
-    async def get_game(self, game_name: str) -> dict:
-        body = f'search "{game_name}"; fields name, multiplayer_modes; limit 10;'
-        response = await self.session.post(IGDB_GAMES_ENDPOINT, headers=self.headers, data=body)
-        response_body = await response.text()
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            raise ApiException(f"Failed to get game from IGDB. {response_body} {e}", e)
-
-        games = await response.json()
-        if len(games) == 0:
-            return {}
-
-        # Take the first returned game unless we have an exact match
-        requested_game = games[0]
-        for game in games:
-            if game["name"].lower() == game_name.lower():
-                requested_game = game
-                break
-
-        return requested_game
-
-    async def get_multiplayer_info(self, multiplayer_modes: list[int]) -> MultiplayerInfo:
-        body = f'fields campaigncoop, offlinecoop, offlinecoopmax, offlinemax, onlinecoopmax, onlinemax; where id = ({",".join(map(str, multiplayer_modes))});'
-        response = await self.session.post(IGDB_MULTIPLAYER_MODES_ENDPOINT, headers=self.headers, data=body)
-        response_body = await response.text()
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            raise ApiException(f"Failed to get multiplayer modes from IGDB. {response_body} {e}", e)
+def get_search_query(game_name: str) -> str:
+    search_text = game_name.replace('"', '\\"')
+    multiplayer_fields = ", ".join(f"multiplayer_modes.{field}" for field in MULTIPLAYER_MODE_FIELDS)
+    return f'search "{search_text}"; fields name, {multiplayer_fields}; limit 10;'
+
+
+def pick_game(games: list[dict], game_name: str) -> dict:
+    if len(games) == 0:
+        return {}
+
+    # Take the first returned game unless we have an exact match
+    for game in games:
+        if game["name"].lower() == game_name.lower():
+            return game
+    return games[0]
+
 
-        modes = await response.json()   # type: list[dict]
+def get_multiplayer_info(multiplayer_modes: list[dict]) -> MultiplayerInfo:
+    multiplayer_info = MultiplayerInfo()
+    for mode in multiplayer_modes:
+        multiplayer_info.update_data(mode)
 
-        multiplayer_info = MultiplayerInfo()
-        for mode in modes:
-            multiplayer_info.update_data(mode)
+    return multiplayer_info
 
-        return multiplayer_info
+
+# The access token is shared between lookups until it expires
+igdb_api = IgdbApi()
 
 
 async def get_multiplayer_info_from_igdb(bot: Bot, game_name: str) -> Optional[MultiplayerInfo]:
-    async with aiohttp.ClientSession() as session:
-        api = IgdbApi(session)
+    cached_games = await load_igdb_games([game_name])
+    if normalize_game_name(game_name) in cached_games:
+        igdb_game = cached_games[normalize_game_name(game_name)]
+        game = {} if igdb_game.igdb_id is None else {"name": igdb_game.name, "multiplayer_modes": igdb_game.multiplayer_modes}
+    else:
         try:
-            await api.authenticate()
+            game = await igdb_api.get_game(game_name)
+        except ApiException as e:
+            # Sent as an exception, so the same failure is only reported once in a while during an outage
+            await send_error_message(bot, ApiException(f"Failed to get multiplayer info from IGDB. {e}"))
+            return None
+        await save_igdb_games({game_name: game})
 
-            game = await api.get_game(game_name)
-            if "multiplayer_modes" in game:
-                return await api.get_multiplayer_info(game["multiplayer_modes"])
-            elif len(game) != 0:
-                # Game does not have multiplayer info (either single player or just not known)
-                return MultiplayerInfo()
+    return to_multiplayer_info(game)
 
-        except ApiException as e:
-            await send_error_message(bot, f"Failed to get free-to-keep games. {e}")
 
+def to_multiplayer_info(game: dict) -> Optional[MultiplayerInfo]:
+    if len(game) == 0:
         return None
+    if game.get("multiplayer_modes"):
+        return get_multiplayer_info(game["multiplayer_modes"])
+    # Game does not have multiplayer info (either single player or just not known)
+    return MultiplayerInfo()
+
+
+def apply_multiplayer_info(game: Game, multiplayer_info: MultiplayerInfo):
+    if multiplayer_info.max_players_online > 0:
+        game.player_count = multiplayer_info.max_players_online
+    if multiplayer_info.max_players_offline > 0:
+        game.local = True
+        if multiplayer_info.max_players_online == 0:
+            game.player_count = multiplayer_info.max_players_offline
+    if multiplayer_info.campaign_coop is False:
+        if game.notes is None:
+            game.notes = []
+        if NO_COOP_CAMPAIGN_NOTE not in game.notes:
+            game.notes.append(NO_COOP_CAMPAIGN_NOTE)
+
+
+async def backfill_igdb_multiplayer_info() -> set[int]:
+    """
+    Looks up the multiplayer info of all unfinished games that do not have a player count yet, searching IGDB in
+    multiquery batches for the names that are not cached, and saves the changed games in batches.
+    Returns the IDs of the servers that had any game change.
+    """
+    def get_games(db_session: Session) -> list[Game]:
+        return (
+            db_session.query(Game)
+                .filter(Game.finished.is_(False))
+                .filter(Game.player_count.is_(None))
+                .all()
+        )
+
+    games = await run_in_db_session(get_games)
+
+    # Multiple servers can have the same game, so only search for each name once
+    game_names = {}     # type: dict[str, str]
+    for game in games:
+        game_names.setdefault(normalize_game_name(game.name), game.name)
+
+    cached_games = await load_igdb_games(list(game_names.values()))
+    igdb_games = {}     # type: dict[str, dict]
+    for search_name, igdb_game in cached_games.items():
+        if igdb_game.igdb_id is not None:
+            igdb_games[search_name] = {"name": igdb_game.name, "multiplayer_modes": igdb_game.multiplayer_modes}
+
+    # The rate limiter spaces out the requests, so they can be sent one after another
+    uncached_names = [game_name for search_name, game_name in game_names.items() if search_name not in cached_games]
+    for start in range(0, len(uncached_names), IGDB_MULTIQUERY_SIZE):
+        batch = uncached_names[start:start + IGDB_MULTIQUERY_SIZE]
+        try:
+            found_games = await igdb_api.get_games(batch)
+        except ApiException as e:
+            log(f"Stopped backfilling multiplayer info. {e}")
+            break
+        await save_igdb_games(found_games)
+        for game_name, game in found_games.items():
+            if len(game) != 0:
+                igdb_games[normalize_game_name(game_name)] = game
+
+    # Only save the games whose multiplayer info has changed
+    changed_games = []      # type: list[tuple[Game, MultiplayerInfo]]
+    for game in games:
+        multiplayer_info = to_multiplayer_info(igdb_games.get(normalize_game_name(game.name), {}))
+        if multiplayer_info is None:
+            continue
+        old_info = (game.player_count, game.local, list(game.notes or []))
+        apply_multiplayer_info(game, multiplayer_info)
+        if (game.player_count, game.local, list(game.notes or [])) != old_info:
+            changed_games.append((game, multiplayer_info))
+
+    def save_multiplayer_info(db_session: Session, games_batch: list[tuple[Game, MultiplayerInfo]]) -> set[int]:
+        multiplayer_infos = {(game.server_id, game.id): multiplayer_info for game, multiplayer_info in games_batch}
+        saved_games = (
+            db_session.query(Game)
+                .filter(tuple_(Game.server_id, Game.id).in_(multiplayer_infos.keys()))
+                .filter(Game.player_count.is_(None))
+                .all()
+        )   # type: list[Game]
+
+        # Apply the info to the games as they are now, so edits made during the lookups, like new notes, are kept
+        for saved_game in saved_games:
+            apply_multiplayer_info(saved_game, multiplayer_infos[(saved_game.server_id, saved_game.id)])
+        return set(saved_game.server_id for saved_game in saved_games if db_session.is_modified(saved_game))
+
+    # Commit in batches, so no write transaction is held open for long
+    changed_server_ids = set()      # type: set[int]
+    for start in range(0, len(changed_games), MULTIPLAYER_COMMIT_BATCH_SIZE):
+        changed_server_ids.update(await run_in_db_session(save_multiplayer_info, changed_games[start:start + MULTIPLAYER_COMMIT_BATCH_SIZE]))
+
+    log(f"Backfilled multiplayer info for {len(game_names)} game names, {len(uncached_names)} of them searched on IGDB. {len(changed_games)} games changed")
+    return changed_server_ids
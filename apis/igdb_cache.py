@@ -0,0 +1,58 @@
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database.db import run_in_db_session
+from database.models import IgdbGame
+
+# How long cached IGDB games stay valid, in seconds
+IGDB_GAME_TTL = 30 * 24 * 60 * 60
+# Games that could not be found might get added to IGDB later, so search for them again sooner
+IGDB_NOT_FOUND_TTL = 7 * 24 * 60 * 60
+
+
+def normalize_game_name(game_name: str) -> str:
+    return " ".join(game_name.lower().split())
+
+
+def is_igdb_game_fresh(igdb_game: IgdbGame) -> bool:
+    ttl = IGDB_GAME_TTL if igdb_game.igdb_id is not None else IGDB_NOT_FOUND_TTL
+    return time.time() - igdb_game.updated_at < ttl
+
+
+async def load_igdb_games(game_names: list[str]) -> dict[str, IgdbGame]:
+    """
+    Returns the fresh cached IGDB games for the given names, by their normalized name.
+    """
+    search_names = set(normalize_game_name(game_name) for game_name in game_names)
+
+    def load(db_session: Session) -> list[IgdbGame]:
+        return (
+            db_session.query(IgdbGame)
+                .filter(IgdbGame.search_name.in_(search_names))
+                .all()
+        )
+
+    igdb_games = await run_in_db_session(load)
+    return {igdb_game.search_name: igdb_game for igdb_game in igdb_games if is_igdb_game_fresh(igdb_game)}
+
+
+async def save_igdb_games(games: dict[str, Optional[dict]]) -> None:
+    """
+    Caches the IGDB games found for the given names, where None means that no game was found.
+    """
+    def save(db_session: Session):
+        now = time.time()
+        for game_name, game in games.items():
+            game = game or {}
+            db_session.merge(IgdbGame(
+                search_name=normalize_game_name(game_name),
+                igdb_id=game.get("id"),
+                name=game.get("name"),
+                multiplayer_modes=game.get("multiplayer_modes"),
+                updated_at=now,
+            ))
+
+    if len(games) > 0:
+        await run_in_db_session(save)
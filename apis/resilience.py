@@ -0,0 +1,204 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from shared.exceptions import ApiUnavailableException
+from shared.logger import log
+
+# Consecutive failures after which requests to a host are refused for a while
+CIRCUIT_FAILURE_THRESHOLD = 5
+# Seconds the circuit stays open, before a single trial request is let through
+CIRCUIT_RESET_TIMEOUT = 60
+# Amount of latencies kept per host for the percentiles
+LATENCY_SAMPLE_SIZE = 1000
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+@dataclass
+class ApiLimits:
+    max_concurrency: int = 10
+    hourly_budget: Optional[int] = None
+    daily_budget: Optional[int] = None
+
+
+API_LIMITS = {
+    # The store API allows about 200 requests per 5 minutes
+    "store.steampowered.com": ApiLimits(max_concurrency=8, hourly_budget=2400),
+    # The web API allows 100,000 requests per day
+    "api.steampowered.com": ApiLimits(max_concurrency=5, daily_budget=100_000),
+    # IGDB allows at most 8 open requests
+    "api.igdb.com": ApiLimits(max_concurrency=8),
+    "id.twitch.tv": ApiLimits(max_concurrency=2, hourly_budget=60),
+    "api.isthereanydeal.com": ApiLimits(max_concurrency=2, hourly_budget=200),
+}
+DEFAULT_API_LIMITS = ApiLimits()
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after it failed several times in a row, and lets one trial request through once in a while
+    to check whether it recovered.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT) -> None:
+        super().__init__()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None   # type: Optional[float]
+        self.trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow_request(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.trial_in_progress or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.trial_in_progress = True
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self) -> bool:
+        """
+        Returns whether this failure opened the circuit.
+        """
+        self.consecutive_failures += 1
+        was_open = self.opened_at is not None
+        if self.trial_in_progress or self.consecutive_failures >= self.failure_threshold:
+            # A failed trial keeps the circuit open for another reset timeout
+            self.opened_at = time.monotonic()
+        self.trial_in_progress = False
+        return not was_open and self.opened_at is not None
+
+
+class RequestBudget:
+    """
+    Counts the requests in the current hour and day, and refuses requests once either limit is reached.
+    """
+
+    def __init__(self, hourly_limit: Optional[int], daily_limit: Optional[int]) -> None:
+        super().__init__()
+        self.hourly_limit = hourly_limit
+        self.daily_limit = daily_limit
+        self.hour = None    # type: Optional[int]
+        self.day = None     # type: Optional[int]
+        self.hourly_count = 0
+        self.daily_count = 0
+
+    def try_spend(self) -> Optional[str]:
+        """
+        Spends one request. Returns the reason if the budget is used up instead.
+        """
+        now = time.time()
+        if self.hour != int(now // HOUR):
+            self.hour = int(now // HOUR)
+            self.hourly_count = 0
+        if self.day != int(now // DAY):
+            self.day = int(now // DAY)
+            self.daily_count = 0
+
+        if self.hourly_limit is not None and self.hourly_count >= self.hourly_limit:
+            return f"hourly budget of {self.hourly_limit} requests used up"
+        if self.daily_limit is not None and self.daily_count >= self.daily_limit:
+            return f"daily budget of {self.daily_limit} requests used up"
+
+        self.hourly_count += 1
+        self.daily_count += 1
+        return None
+
+
+class ApiMetrics:
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = 0
+        self.errors = 0
+        self.rejections = {}    # type: dict[str, int]
+        self.latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)  # type: deque[float]
+
+    def record_response(self, latency: float, failed: bool) -> None:
+        self.requests += 1
+        self.latencies.append(latency)
+        if failed:
+            self.errors += 1
+
+    def record_rejection(self, reason: str) -> None:
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def get_summary(self) -> str:
+        summary = f"{self.requests} requests, {self.errors} errors"
+        if len(self.latencies) > 0:
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            summary += f", latency p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+        if len(self.rejections) > 0:
+            summary += ", rejected: " + ", ".join(f"{count}x {reason}" for reason, count in self.rejections.items())
+        return summary
+
+
+class ApiGuard:
+    """
+    Protects one API host with a circuit breaker, a cap on concurrent requests and request budgets, and measures it.
+    """
+
+    def __init__(self, host: str, limits: ApiLimits) -> None:
+        super().__init__()
+        self.host = host
+        self.circuit_breaker = CircuitBreaker()
+        self.budget = RequestBudget(limits.hourly_budget, limits.daily_budget)
+        self.semaphore = asyncio.Semaphore(limits.max_concurrency)
+        self.metrics = ApiMetrics()
+
+    def check_request(self) -> None:
+        """
+        Raises an ApiUnavailableException if a request to this host should not be sent.
+        """
+        if not self.circuit_breaker.allow_request():
+            self.metrics.record_rejection("circuit open")
+            raise ApiUnavailableException(self.host, "too many recent failures, retrying later")
+
+        reason = self.budget.try_spend()
+        if reason is not None:
+            self.circuit_breaker.trial_in_progress = False
+            self.metrics.record_rejection("budget used up")
+            raise ApiUnavailableException(self.host, reason)
+
+    def record_cancelled(self) -> None:
+        # Let another request check whether the host recovered
+        self.circuit_breaker.trial_in_progress = False
+
+    def record_response(self, latency: float, failed: bool) -> None:
+        self.metrics.record_response(latency, failed)
+        if not failed:
+            self.circuit_breaker.record_success()
+        elif self.circuit_breaker.record_failure():
+            log(f"Stopped sending requests to {self.host} for {self.circuit_breaker.reset_timeout} seconds after {self.circuit_breaker.consecutive_failures} failures")
+
+
+_api_guards = {}    # type: dict[str, ApiGuard]
+
+
+def get_api_guard(host: str) -> ApiGuard:
+    if host not in _api_guards:
+        _api_guards[host] = ApiGuard(host, API_LIMITS.get(host, DEFAULT_API_LIMITS))
+    return _api_guards[host]
+
+
+def get_api_metrics_summary() -> str:
+    lines = []
+    for host, api_guard in sorted(_api_guards.items()):
+        state = " (circuit open)" if api_guard.circuit_breaker.is_open else ""
+        lines.append(f"{host}{state}: {api_guard.metrics.get_summary()}")
+    return "\n".join(lines) if len(lines) > 0 else "No API requests yet."
@@ -1,51 +1,178 @@
+import asyncio
 from io import BytesIO
 from typing import Optional
 
+import aiohttp
 import discord
-import requests
 
-from database.db import db_session_scope
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from apis.http_client import http_request, HttpResponse
+from apis.steam_catalog import get_steam_catalog_index, normalize_app_name
+from apis.steam_cache import load_steam_app, is_details_fresh, is_price_fresh, to_steam_game_data, save_steam_app_details, \
+    save_steam_app_prices, load_banner, save_banner
+from database.db import run_in_db_session
 from database.models import Game, ReleaseState
+from shared.exceptions import ApiException, ApiUnavailableException
 from shared.logger import log
+from shared.rate_limiter import TokenBucket
+
+STEAM_APP_DETAILS_ENDPOINT = "https://store.steampowered.com/api/appdetails"
+STEAM_STORE_SEARCH_ENDPOINT = "https://store.steampowered.com/api/storesearch/"
+
+STEAM_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+
+# The store API allows about 200 requests per 5 minutes per IP address
+STEAM_STORE_RATE_LIMITER = TokenBucket(rate=200 / 300, capacity=20)
+STEAM_PRICE_CONCURRENCY = 8
+# Amount of Steam games whose prices are requested at once
+STEAM_PRICE_BATCH_SIZE = 100
+PRICE_COMMIT_BATCH_SIZE = 100
+
+
+async def steam_get(url: str, params: Optional[dict] = None, rate_limited=True) -> Optional[HttpResponse]:
+    """
+    Sends a GET request to the Steam store, retrying on connection errors, timeouts and temporary error statuses.
+    Requests to the store API are rate limited, which can be turned off for static files like banners.
+    Returns None if every attempt failed to get a response.
+    Raises an ApiUnavailableException if the request was not sent because Steam keeps failing.
+    """
+    try:
+        return await http_request("GET", url, params=params, timeout=STEAM_REQUEST_TIMEOUT,
+                                  rate_limiter=STEAM_STORE_RATE_LIMITER if rate_limited else None)
+    except ApiUnavailableException:
+        raise
+    except ApiException as e:
+        log(f"Steam request failed: {e}")
+        return None
 
 
-def get_steam_game_data(steam_game_id: int) -> Optional[dict]:
+async def get_steam_game_data(steam_game_id: int, with_price=True) -> Optional[dict]:
+    """
+    Returns the details of the given Steam game ID as returned by Steam's appdetails API, using the cache when possible.
+    If the price isn't needed, the cached details can be used even if the cached price is outdated.
+    Returns None if the game wasn't found.
+    Raises an ApiException if Steam could not be asked.
+    """
     # Check if an actual Steam game ID was given
     if steam_game_id is None:
         return None
-    steam_game_id = str(steam_game_id)
+    steam_game_id = int(steam_game_id)
+
+    steam_app = await load_steam_app(steam_game_id)
+    if steam_app is not None and is_details_fresh(steam_app):
+        if not with_price or is_price_fresh(steam_app):
+            return to_steam_game_data(steam_app)
 
-    # API URL for getting info on a specific Steam game
-    url = f"https://store.steampowered.com/api/appdetails?appids={steam_game_id}&cc=eu"
+        # Only the price is outdated, which can be retrieved with a much smaller request
+        price_overviews = await get_steam_game_price_overviews([steam_game_id])
+        if steam_game_id in price_overviews:
+            steam_app.price_overview = price_overviews[steam_game_id]
+            return to_steam_game_data(steam_app)
+
+    steam_game_data = await fetch_steam_game_data(steam_game_id)
+    if steam_game_data is not None:
+        await save_steam_app_details(steam_game_id, steam_game_data)
+
+    return steam_game_data
+
+
+async def fetch_steam_game_data(steam_game_id: int) -> Optional[dict]:
+    """
+    Returns None only if Steam answered that the game does not exist, and raises an ApiException if Steam could not be asked.
+    """
+    steam_game_id = str(steam_game_id)
 
     params = {
         "appids": steam_game_id,
         "cc": "nl",     # Country used for pricing/currency
         "l": "english",
     }
-    response = requests.get(url, params=params)
+    response = await steam_get(STEAM_APP_DETAILS_ENDPOINT, params=params)
+    if response is None:
+        raise ApiException(f"Failed to get game with ID \"{steam_game_id}\" using Steam API: no response")
 
-    if response.status_code >= 300:
-        log(f"Failed to get game with ID \"{steam_game_id}\" using Steam API: {response.status_code}")
-        log(response.json())
-        return None
+    if response.status >= 300:
+        log(response.body)
+        raise ApiException(f"Failed to get game with ID \"{steam_game_id}\" using Steam API: {response.status}")
 
-    response_json = response.json()
-    steam_game_data = response_json.get(steam_game_id, {}).get("data", {})
-    if not steam_game_data:
+    response_json = response.json() or {}
+    steam_game_response = response_json.get(steam_game_id, {})
+    if steam_game_response.get("success") is False:
         log(f"Warning: missing Steam info for Steam game ID {steam_game_id}: {response_json}")
         return None
 
+    steam_game_data = steam_game_response.get("data", {})
+    if not steam_game_data:
+        raise ApiException(f"Steam returned no info for Steam game ID {steam_game_id}: {response_json}")
+
     return steam_game_data
 
 
+async def get_steam_game_price_overviews(steam_game_ids: list[int]) -> dict[int, Optional[dict]]:
+    """
+    Uses the Steam API to retrieve only the "price_overview" of the given Steam game IDs, in a single request, and caches them.
+    Games without a price, like free or unreleased games, have None as price overview.
+    Games that Steam did not find are left out.
+    Raises an ApiException if Steam could not be asked.
+    """
+    params = {
+        "appids": ",".join(str(steam_game_id) for steam_game_id in steam_game_ids),
+        "filters": "price_overview",
+        "cc": "nl",     # Country used for pricing/currency
+        "l": "english",
+    }
+    response = await steam_get(STEAM_APP_DETAILS_ENDPOINT, params=params)
+    if response is None:
+        raise ApiException(f"Failed to get prices for {len(steam_game_ids)} Steam games using Steam API: no response")
+
+    if response.status >= 300:
+        log(response.body)
+        raise ApiException(f"Failed to get prices for {len(steam_game_ids)} Steam games using Steam API: {response.status}")
+
+    response_json = response.json() or {}
+    price_overviews = {}
+    for steam_game_id in steam_game_ids:
+        steam_game_response = response_json.get(str(steam_game_id), {})
+        if not steam_game_response.get("success", False):
+            continue
+        # Games without a price have an empty list as data
+        steam_game_data = steam_game_response.get("data") or {}
+        price_overviews[steam_game_id] = steam_game_data.get("price_overview") or None
+
+    await save_steam_app_prices(price_overviews)
+    return price_overviews
+
+
+async def get_steam_game_prices(steam_game_ids: list[int]) -> dict[int, dict]:
+    """
+    Uses the Steam API to retrieve only the prices of the given Steam game IDs, in a single request.
+    Returns a dictionary mapping Steam game IDs to dictionaries containing the "price_current" and "price_original" keys.
+    Games without a known price in euros, like free or unreleased games, are left out.
+    Raises an ApiException if Steam could not be asked.
+    """
+    price_overviews = await get_steam_game_price_overviews(steam_game_ids)
+
+    prices = {}
+    for steam_game_id, price_overview in price_overviews.items():
+        if price_overview and price_overview["currency"] == "EUR":
+            prices[steam_game_id] = {
+                "price_current": price_overview["final"] / 100,
+                "price_original": price_overview["initial"] / 100,
+            }
+
+    return prices
+
+
 async def get_steam_game_price(steam_game_id: int) -> Optional[dict]:
     """
     Uses the Steam API to search for info on the given Steam game ID.
     Returns a dictionary containing the "id", "price_current", "price_original", and "release_state" keys.
     Returns None if the game wasn't found.
+    Raises an ApiException if Steam could not be asked.
     """
-    steam_game_data = get_steam_game_data(steam_game_id)
+    steam_game_data = await get_steam_game_data(steam_game_id)
     if steam_game_data is None:
         return None
 
@@ -89,40 +216,140 @@ async def get_steam_game_price(steam_game_id: int) -> Optional[dict]:
     return steam_info
 
 
-def get_steam_game_banner(steam_game_id: int) -> Optional[discord.File]:
+async def get_steam_game_banner(steam_game_id: int) -> Optional[discord.File]:
     """
     Uses the Steam API to download the banner of the given Steam game ID, and upload it to Discord.
     Returns a Discord File object.
-    Returns None if the game wasn't found.
+    Returns None if the game wasn't found, or if Steam could not be asked.
     """
-    steam_game_data = get_steam_game_data(steam_game_id)
+    try:
+        steam_game_data = await get_steam_game_data(steam_game_id, with_price=False)
+    except ApiException as e:
+        log(f"Failed to get the banner of Steam game ID \"{steam_game_id}\": {e}")
+        return None
     if steam_game_data is None:
         return None
     game_name = steam_game_data.get("name", "")
 
-    # Fetch the banner
-    banner_url = steam_game_data.get("header_image")
-    if banner_url is None:
-        return None
-    response = requests.get(banner_url)
-    if response.status_code >= 300:
-        log(f"Failed to get banner for Steam game ID \"{steam_game_id}\" using Steam API: {response.status_code}")
-        log(response.json())
-        return None
+    # Banners don't change, so use the downloaded one if we have it
+    banner = await load_banner(steam_game_id)
+    if banner is None:
+        # Fetch the banner
+        banner_url = steam_game_data.get("header_image")
+        if banner_url is None:
+            return None
+        try:
+            response = await steam_get(banner_url, rate_limited=False)
+        except ApiUnavailableException as e:
+            log(f"Failed to get the banner of Steam game ID \"{steam_game_id}\": {e}")
+            return None
+        if response is None:
+            return None
+        if response.status >= 300:
+            log(f"Failed to get banner for Steam game ID \"{steam_game_id}\" using Steam API: {response.status}")
+            return None
+
+        banner = response.body
+        await save_banner(steam_game_id, banner)
 
     # Convert the banner to a Discord File and return it
-    image_bytes = BytesIO(response.content)
+    image_bytes = BytesIO(banner)
     return discord.File(image_bytes, f"{game_name} banner.jpg")
 
 
-async def update_database_steam_prices():
-    with db_session_scope() as db_session:
-        games = db_session.query(Game).all()    # type: list[Game]
-        for game in games:
-            steam_game_info = await get_steam_game_price(game.steam_id)
-            update_game_steam_prices_fields(game, steam_game_info)
-
-    log("Retrieved Steam prices")
+async def update_database_steam_prices() -> set[int]:
+    """
+    Retrieves the latest prices of all unfinished games linked to Steam, and saves the changed ones in batches.
+    Returns the IDs of the servers that had any game's price or release state change.
+    """
+    def get_games(db_session: Session) -> list[Game]:
+        return (
+            db_session.query(Game)
+                .filter(Game.finished.is_(False))
+                .filter(Game.steam_id.isnot(None))
+                .all()
+        )
+
+    games = await run_in_db_session(get_games)
+
+    # Multiple servers can have the same game, so only retrieve each price once
+    steam_ids = sorted(set(game.steam_id for game in games))
+    semaphore = asyncio.Semaphore(STEAM_PRICE_CONCURRENCY)
+
+    # Games whose lookup failed keep their stored values, as a failed request says nothing about the game
+    failed_steam_ids = set()    # type: set[int]
+
+    async def get_prices(steam_ids_batch: list[int]) -> dict[int, dict]:
+        async with semaphore:
+            try:
+                return await get_steam_game_prices(steam_ids_batch)
+            except ApiException as e:
+                # Looking up every game of the batch separately would most likely fail as well
+                log(f"Skipped the prices of {len(steam_ids_batch)} Steam games: {e}")
+                failed_steam_ids.update(steam_ids_batch)
+                return {}
+
+    async def get_price(steam_id: int) -> Optional[dict]:
+        async with semaphore:
+            try:
+                return await get_steam_game_price(steam_id)
+            except ApiException:
+                failed_steam_ids.add(steam_id)
+                return None
+
+    # First retrieve just the prices, for many games per request
+    batches = [steam_ids[start:start + STEAM_PRICE_BATCH_SIZE] for start in range(0, len(steam_ids), STEAM_PRICE_BATCH_SIZE)]
+    prices = {}     # type: dict[int, dict]
+    for batch_prices in await asyncio.gather(*[get_prices(batch) for batch in batches]):
+        prices.update(batch_prices)
+
+    # Released games stay released, so only retrieve all details of games whose release state could have changed,
+    # or whose price could not be retrieved, like free or unreleased games
+    detail_steam_ids = set(steam_id for steam_id in steam_ids if steam_id not in prices)
+    detail_steam_ids.update(game.steam_id for game in games if game.release_state is not ReleaseState.RELEASED)
+    detail_steam_ids = sorted(detail_steam_ids - failed_steam_ids)
+
+    # None means that Steam answered that the game does not exist
+    steam_game_details = {}     # type: dict[int, Optional[dict]]
+    for steam_id, steam_game_info in zip(detail_steam_ids, await asyncio.gather(*[get_price(steam_id) for steam_id in detail_steam_ids])):
+        if steam_id not in failed_steam_ids:
+            steam_game_details[steam_id] = steam_game_info
+
+    # Only save the games whose prices have changed
+    changed_games = []
+    for game in games:
+        if game.steam_id in steam_game_details:
+            steam_game_info = steam_game_details[game.steam_id]
+        elif game.steam_id in prices:
+            # Without the details, the release state is either known to be released, or unchanged
+            steam_game_info = {"id": game.steam_id, "release_state": game.release_state, **prices[game.steam_id]}
+        else:
+            continue
+
+        old_prices = (game.price_current, game.price_original, game.release_state)
+        update_game_steam_prices_fields(game, steam_game_info)
+        if (game.price_current, game.price_original, game.release_state) != old_prices:
+            changed_games.append(game)
+
+    def save_prices(db_session: Session, games_batch: list[Game]):
+        game_prices = []
+        for game in games_batch:
+            game_prices.append({
+                "server_id": game.server_id,
+                "id": game.id,
+                "price_current": game.price_current,
+                "price_original": game.price_original,
+                "release_state": game.release_state,
+            })
+        db_session.execute(update(Game), game_prices)
+
+    # Commit in batches, so no write transaction is held open for long
+    for start in range(0, len(changed_games), PRICE_COMMIT_BATCH_SIZE):
+        await run_in_db_session(save_prices, changed_games[start:start + PRICE_COMMIT_BATCH_SIZE])
+
+    log(f"Retrieved Steam prices for {len(steam_ids) - len(failed_steam_ids)} Steam games, {len(detail_steam_ids)} of them with all details. "
+        f"{len(failed_steam_ids)} failed, {len(changed_games)} games changed")
+    return set(game.server_id for game in changed_games)
 
 
 def update_game_steam_prices_fields(game: Game, steam_game_info: dict):
@@ -137,27 +364,31 @@ def update_game_steam_prices_fields(game: Game, steam_game_info: dict):
         game.release_state = None
 
 
-def search_steam_for_game(game_name: str) -> Optional[dict]:
+async def search_steam_for_game(game_name: str) -> Optional[dict]:
     """
     Uses the Steam API to search for the given game.
     Returns a dictionary retrieved from the Steam API matching the given game.
     Returns None if no results were found.
     """
-    game_name = game_name.lower()
+    # Look the game up in the local Steam catalog first, which does not need a request
+    catalog_match = (await get_steam_catalog_index()).match(game_name)
+    if catalog_match is not None:
+        return {"id": catalog_match[0], "name": catalog_match[1]}
 
-    # API URL for searching Steam games
-    url = "https://store.steampowered.com/api/storesearch/"
+    game_name = game_name.lower()
 
     params = {
         "term": game_name,
         "cc": "nl",     # Country used for pricing/currency
         "l": "english",
     }
-    response = requests.get(url, params=params)
+    response = await steam_get(STEAM_STORE_SEARCH_ENDPOINT, params=params)
+    if response is None:
+        return None
 
-    if response.status_code >= 300:
-        log(f"Failed to search for \"{game_name}\" using Steam API: {response.status_code}")
-        log(response.json())
+    if response.status >= 300:
+        log(f"Failed to search for \"{game_name}\" using Steam API: {response.status}")
+        log(response.body)
         return None
 
     response_json = response.json()
@@ -165,9 +396,10 @@ def search_steam_for_game(game_name: str) -> Optional[dict]:
     if len(game_results) == 0:
         return None
 
-    # Check if we find any exact matches. If not, use the first result
+    # Check if we find any exact matches, ignoring symbols like ™. If not, use the first result
+    normalized_game_name = normalize_app_name(game_name)
     for game in game_results:
-        if game["name"].lower() == game_name:
+        if normalize_app_name(game["name"]) == normalized_game_name:
             game_match = game
             break
     else:
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database.db import run_in_db_session
+from database.models import SteamApp
+
+# How long cached Steam app data stays valid, in seconds
+STEAM_DETAILS_TTL = 7 * 24 * 60 * 60
+# Unreleased games can be released at any moment, so check their details more often
+STEAM_UNRELEASED_DETAILS_TTL = 24 * 60 * 60
+STEAM_PRICE_TTL = 60 * 60
+
+STEAM_BANNER_DIRECTORY = os.path.join("cache", "steam_banners")
+
+
+def is_details_fresh(steam_app: SteamApp) -> bool:
+    if steam_app.details_updated_at is None:
+        return False
+    ttl = STEAM_UNRELEASED_DETAILS_TTL if steam_app.coming_soon else STEAM_DETAILS_TTL
+    return time.time() - steam_app.details_updated_at < ttl
+
+
+def is_price_fresh(steam_app: SteamApp) -> bool:
+    return steam_app.price_updated_at is not None and time.time() - steam_app.price_updated_at < STEAM_PRICE_TTL
+
+
+def to_steam_game_data(steam_app: SteamApp) -> dict:
+    """
+    Converts the cached app back into the format returned by Steam's appdetails API.
+    """
+    steam_game_data = {
+        "steam_appid": steam_app.id,
+        "name": steam_app.name,
+        "header_image": steam_app.header_image,
+        "genres": steam_app.genres or [],
+        "release_date": {"coming_soon": steam_app.coming_soon},
+        "is_free": steam_app.is_free,
+    }
+    if steam_app.price_overview:
+        steam_game_data["price_overview"] = steam_app.price_overview
+    return steam_game_data
+
+
+async def load_steam_app(steam_game_id: int) -> Optional[SteamApp]:
+    return await run_in_db_session(lambda db_session: db_session.get(SteamApp, steam_game_id))
+
+
+async def save_steam_app_details(steam_game_id: int, steam_game_data: dict) -> None:
+    """
+    Caches the details and the price of an app, as returned by Steam's appdetails API.
+    """
+    def save(db_session: Session):
+        now = time.time()
+        steam_app = {
+            "id": steam_game_id,
+            "name": steam_game_data.get("name"),
+            "header_image": steam_game_data.get("header_image"),
+            "genres": steam_game_data.get("genres", []),
+            "coming_soon": steam_game_data.get("release_date", {}).get("coming_soon", False),
+            "is_free": steam_game_data.get("is_free", False),
+            "details_updated_at": now,
+            "price_overview": steam_game_data.get("price_overview"),
+            "price_updated_at": now,
+        }
+        # Upsert, as the same app can be saved by another lookup at the same time
+        statement = insert(SteamApp)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SteamApp.id],
+            set_={column: statement.excluded[column] for column in steam_app if column != "id"},
+        )
+        db_session.execute(statement, [steam_app])
+
+    await run_in_db_session(save)
+
+
+async def save_steam_app_prices(price_overviews: dict[int, Optional[dict]]) -> None:
+    """
+    Caches the prices of apps, where None means that the app does not have a price.
+    """
+    def save(db_session: Session):
+        now = time.time()
+        # The details will be retrieved once they are needed
+        statement = insert(SteamApp)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SteamApp.id],
+            set_={"price_overview": statement.excluded.price_overview, "price_updated_at": statement.excluded.price_updated_at},
+        )
+        db_session.execute(statement, [
+            {"id": steam_game_id, "price_overview": price_overview, "price_updated_at": now}
+            for steam_game_id, price_overview in price_overviews.items()
+        ])
+
+    if len(price_overviews) > 0:
+        await run_in_db_session(save)
+
+
+def get_banner_filepath(steam_game_id: int) -> str:
+    return os.path.join(STEAM_BANNER_DIRECTORY, f"{steam_game_id}.jpg")
+
+
+async def load_banner(steam_game_id: int) -> Optional[bytes]:
+    def load() -> Optional[bytes]:
+        try:
+            with open(get_banner_filepath(steam_game_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    return await asyncio.to_thread(load)
+
+
+async def save_banner(steam_game_id: int, banner: bytes) -> None:
+    def save():
+        os.makedirs(STEAM_BANNER_DIRECTORY, exist_ok=True)
+        # Write to a temporary file first, so a crash never leaves a partial banner behind
+        filepath = get_banner_filepath(steam_game_id)
+        with open(f"{filepath}.partial", "wb") as f:
+            f.write(banner)
+        os.replace(f"{filepath}.partial", filepath)
+
+    await asyncio.to_thread(save)
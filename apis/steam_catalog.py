@@ -0,0 +1,234 @@
+import asyncio
+import bisect
+import difflib
+import re
+import unicodedata
+from typing import Optional
+
+import aiohttp
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from apis.http_client import http_request
+from apis.steam_web import STEAM_WEB_API_KEY
+from database.db import run_in_db_session
+from database.models import SteamCatalogApp
+from shared.exceptions import ApiException
+from shared.logger import log
+
+STEAM_GET_APP_LIST_ENDPOINT = "https://api.steampowered.com/IStoreService/GetAppList/v1"
+# The maximum amount of apps Steam returns per page
+STEAM_APP_LIST_PAGE_SIZE = 50_000
+STEAM_APP_LIST_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=5)
+CATALOG_COMMIT_BATCH_SIZE = 5000
+
+# Names that are at least this similar are considered the same game
+CATALOG_MATCH_THRESHOLD = 0.9
+# Maximum amount of apps that are compared with a name when matching it
+MAX_PREFIX_CANDIDATES = 50
+MAX_WORD_CANDIDATES = 2000
+
+IGNORED_CHARACTERS_PATTERN = re.compile(r"[™®©'’]")
+SEPARATOR_CHARACTERS_PATTERN = re.compile(r"[^\w]+")
+ROMAN_NUMERAL_PATTERN = re.compile(r"^(?=[ivxlc]+$)c{0,3}(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+ROMAN_NUMERAL_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+
+def normalize_app_name(name: str) -> str:
+    """
+    Makes names comparable, so that for example "The Witcher® 3: Wild Hunt" equals "the witcher 3 wild hunt".
+    """
+    name = unicodedata.normalize("NFKD", name.lower())
+    name = IGNORED_CHARACTERS_PATTERN.sub("", name)
+    name = "".join(character for character in name if not unicodedata.combining(character))
+    return SEPARATOR_CHARACTERS_PATTERN.sub(" ", name).strip()
+
+
+def get_name_numbers(normalized_name: str) -> list[int]:
+    """
+    Returns the numbers in a normalized name, including Roman numerals, which tell sequels apart.
+    """
+    numbers = []
+    for word in normalized_name.split():
+        if word.isdigit():
+            numbers.append(int(word))
+        elif ROMAN_NUMERAL_PATTERN.match(word):
+            values = [ROMAN_NUMERAL_VALUES[character] for character in word]
+            # A numeral smaller than the one after it is subtracted, like in "iv"
+            numbers.append(sum(-value if index + 1 < len(values) and value < values[index + 1] else value for index, value in enumerate(values)))
+    return sorted(numbers)
+
+
+class SteamCatalogIndex:
+    """
+    In-memory index of the Steam app catalog, which matches names exactly, by prefix and by similar words.
+    """
+
+    def __init__(self, apps: list[tuple[int, str]]) -> None:
+        super().__init__()
+        self.names = {}     # type: dict[int, str]
+        self.app_ids_by_name = {}   # type: dict[str, list[int]]
+        self.app_ids_by_word = {}   # type: dict[str, list[int]]
+        self.normalized_names = {}  # type: dict[int, str]
+
+        for app_id, name in apps:
+            normalized_name = normalize_app_name(name)
+            if not normalized_name:
+                continue
+            self.names[app_id] = name
+            self.normalized_names[app_id] = normalized_name
+            self.app_ids_by_name.setdefault(normalized_name, []).append(app_id)
+            for word in set(normalized_name.split()):
+                self.app_ids_by_word.setdefault(word, []).append(app_id)
+
+        # Apps with the same name are usually re-releases, so prefer the original one
+        for app_ids in self.app_ids_by_name.values():
+            app_ids.sort()
+        self.sorted_names = sorted(self.app_ids_by_name.keys())
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, name: str, limit: int = 5) -> list[tuple[int, str, float]]:
+        """
+        Returns up to limit apps as (app ID, name, similarity), the most similar first.
+        """
+        normalized_name = normalize_app_name(name)
+        if not normalized_name:
+            return []
+
+        candidate_names = set()
+        if normalized_name in self.app_ids_by_name:
+            candidate_names.add(normalized_name)
+
+        # Names that start with the given name, like sequels and editions
+        start = bisect.bisect_left(self.sorted_names, normalized_name)
+        for app_name in self.sorted_names[start:start + MAX_PREFIX_CANDIDATES]:
+            if not app_name.startswith(normalized_name):
+                break
+            candidate_names.add(app_name)
+
+        # Names that share the given name's rarest word, to allow for typos and reordered words
+        words = [word for word in normalized_name.split() if word in self.app_ids_by_word]
+        if len(words) > 0:
+            rarest_word = min(words, key=lambda word: len(self.app_ids_by_word[word]))
+            for app_id in self.app_ids_by_word[rarest_word][:MAX_WORD_CANDIDATES]:
+                candidate_names.add(self.normalized_names[app_id])
+
+        results = []
+        for app_name in candidate_names:
+            matcher = difflib.SequenceMatcher(None, normalized_name, app_name)
+            # Cheap upper bounds of the similarity, to skip most candidates early
+            if matcher.real_quick_ratio() < CATALOG_MATCH_THRESHOLD / 2 or matcher.quick_ratio() < CATALOG_MATCH_THRESHOLD / 2:
+                continue
+            similarity = 1.0 if app_name == normalized_name else matcher.ratio()
+            app_id = self.app_ids_by_name[app_name][0]
+            results.append((app_id, self.names[app_id], similarity))
+
+        # On ties, prefer shorter names, like a base game over its editions
+        results.sort(key=lambda result: (-result[2], len(result[1]), result[0]))
+        return results[:limit]
+
+    def match(self, name: str) -> Optional[tuple[int, str]]:
+        """
+        Returns the ID and the name of the app that is confidently the given game, or None if there is none.
+        Similar names only match if they have the same numbers, as "Half-Life 3" is not "Half-Life 2".
+        """
+        normalized_name = normalize_app_name(name)
+        app_ids = self.app_ids_by_name.get(normalized_name)
+        if app_ids is not None:
+            return app_ids[0], self.names[app_ids[0]]
+
+        numbers = get_name_numbers(normalized_name)
+        for app_id, app_name, similarity in self.search(name):
+            if similarity < CATALOG_MATCH_THRESHOLD:
+                break
+            if get_name_numbers(self.normalized_names[app_id]) == numbers:
+                return app_id, app_name
+        return None
+
+
+_catalog_index = None   # type: Optional[SteamCatalogIndex]
+_catalog_index_lock = asyncio.Lock()
+
+
+async def get_steam_catalog_index() -> SteamCatalogIndex:
+    """
+    Returns the index of the stored Steam catalog, building it on first use.
+    """
+    global _catalog_index
+    async with _catalog_index_lock:
+        if _catalog_index is None:
+            _catalog_index = await run_in_db_session(build_steam_catalog_index)
+    return _catalog_index
+
+
+def build_steam_catalog_index(db_session: Session) -> SteamCatalogIndex:
+    apps = db_session.query(SteamCatalogApp.id, SteamCatalogApp.name).all()
+    return SteamCatalogIndex(apps)
+
+
+async def fetch_steam_app_list(modified_since: int) -> list[dict]:
+    """
+    Retrieves all pages of Steam games that changed after the given Unix timestamp.
+    """
+    params = {
+        "key": STEAM_WEB_API_KEY,
+        "if_modified_since": modified_since,
+        "include_games": "true",
+        "include_dlc": "false",
+        "include_software": "false",
+        "include_videos": "false",
+        "include_hardware": "false",
+        "max_results": STEAM_APP_LIST_PAGE_SIZE,
+        "last_appid": 0,
+    }
+
+    apps = []
+    while True:
+        response = await http_request("GET", STEAM_GET_APP_LIST_ENDPOINT, params=params, timeout=STEAM_APP_LIST_TIMEOUT)
+        try:
+            response.raise_for_status()
+        except Exception as e:
+            raise ApiException(f"Failed to get the Steam app list. {e}", e)
+
+        payload = response.json().get("response", {})
+        apps.extend(payload.get("apps", []))
+        if not payload.get("have_more_results"):
+            return apps
+        params["last_appid"] = payload["last_appid"]
+
+
+async def update_steam_catalog() -> None:
+    """
+    Saves the Steam games that changed since the last update, and rebuilds the index.
+    """
+    global _catalog_index
+
+    def get_last_modified(db_session: Session) -> int:
+        return db_session.query(func.max(SteamCatalogApp.last_modified)).scalar() or 0
+
+    apps = await fetch_steam_app_list(await run_in_db_session(get_last_modified))
+
+    def save_apps(db_session: Session, apps_batch: list[dict]):
+        statement = insert(SteamCatalogApp)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SteamCatalogApp.id],
+            set_={"name": statement.excluded.name, "last_modified": statement.excluded.last_modified},
+        )
+        db_session.execute(statement, [
+            {"id": app["appid"], "name": app["name"], "last_modified": app.get("last_modified", 0)} for app in apps_batch
+        ])
+
+    apps = [app for app in apps if app.get("name")]
+    # Commit in batches, so no write transaction is held open for long
+    for start in range(0, len(apps), CATALOG_COMMIT_BATCH_SIZE):
+        await run_in_db_session(save_apps, apps[start:start + CATALOG_COMMIT_BATCH_SIZE])
+
+    if len(apps) > 0 or _catalog_index is None:
+        index = await run_in_db_session(build_steam_catalog_index)
+        async with _catalog_index_lock:
+            _catalog_index = index
+
+    log(f"Updated the Steam catalog with {len(apps)} changed games")
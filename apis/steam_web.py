@@ -1,11 +1,16 @@
+import asyncio
 import os
+import time
 
-import aiohttp
 from dotenv import load_dotenv
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
-from database.models import Game, GameUserData
+from apis.http_client import http_request
+from database.db import run_in_db_session
+from database.models import Game, GameUserData, ServerMember
 from shared.exceptions import ApiException, UserNotFoundException, NoAccessException
+from shared.logger import log
 
 load_dotenv()
 
@@ -17,6 +22,13 @@ STEAM_GET_OWNED_GAMES_ENDPOINT = "https://api.steampowered.com/IPlayerService/Ge
 
 PLAYED_BEFORE_MINUTES_THRESHOLD = 120
 
+# How long a fetched Steam library is reused, in seconds
+OWNED_GAMES_TTL = 60 * 60
+OWNED_GAMES_CONCURRENCY = 5
+
+# Fetched Steam libraries by Steam user ID, with the time they were fetched at
+_owned_games_cache = {}     # type: dict[int, tuple[float, dict[int, SteamGameInfo]]]
+
 
 class SteamGameInfo:
 
@@ -28,60 +40,163 @@ class SteamGameInfo:
 
 
 async def get_steam_user_id(vanity_url: str) -> int:
-    async with aiohttp.ClientSession() as session:
-        params = {
-            "key": STEAM_WEB_API_KEY,
-            "vanityurl": vanity_url,
-        }
-
-        response = await session.get(STEAM_RESOLVE_VANITY_URL_ENDPOINT, params=params)
-        response_body = await response.text()
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            raise ApiException(f"Failed to fetch Steam user ID. {response_body} {e}", e)
+    params = {
+        "key": STEAM_WEB_API_KEY,
+        "vanityurl": vanity_url,
+    }
 
-        payload = await response.json()
-        steam_user_id = payload.get("response", {}).get("steamid", None)    # type: int
-        if steam_user_id is None:
-            raise UserNotFoundException(f"Could not find Steam user <https://steamcommunity.com/id/{vanity_url}>.")
+    response = await http_request("GET", STEAM_RESOLVE_VANITY_URL_ENDPOINT, params=params)
+    try:
+        response.raise_for_status()
+    except Exception as e:
+        raise ApiException(f"Failed to fetch Steam user ID. {response.text()} {e}", e)
 
-        return steam_user_id
+    payload = response.json()
+    steam_user_id = payload.get("response", {}).get("steamid", None)    # type: int
+    if steam_user_id is None:
+        raise UserNotFoundException(f"Could not find Steam user <https://steamcommunity.com/id/{vanity_url}>.")
 
+    return steam_user_id
 
-async def get_owned_steam_games(steam_user_id: int) -> dict[int, SteamGameInfo]:
-    async with aiohttp.ClientSession() as session:
-        params = {
-            "key": STEAM_WEB_API_KEY,
-            "steamid": steam_user_id,
-        }
 
-        response = await session.get(STEAM_GET_OWNED_GAMES_ENDPOINT, params=params)
-        if response.status == 400:
-            raise UserNotFoundException(f"Could not find Steam user <https://steamcommunity.com/profiles/{steam_user_id}>.")
-        response_body = await response.text()
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            raise ApiException(f"Failed to fetch games for Steam user ID. {response_body} {e}", e)
+async def get_owned_steam_games(steam_user_id: int, max_age: float = OWNED_GAMES_TTL) -> dict[int, SteamGameInfo]:
+    """
+    Returns the games owned by the Steam user, reusing their library if it was fetched less than max_age seconds ago.
+    """
+    cached = _owned_games_cache.get(steam_user_id)
+    if cached is not None and time.time() - cached[0] < max_age:
+        return cached[1]
+
+    owned_games = await fetch_owned_steam_games(steam_user_id)
+    _owned_games_cache[steam_user_id] = (time.time(), owned_games)
+    return owned_games
+
+
+async def get_owned_steam_games_of_users(steam_user_ids: list[int]) -> dict[int, dict[int, SteamGameInfo] | Exception]:
+    """
+    Returns the games owned by each of the Steam users, fetching the libraries that are not cached in parallel.
+    Instead of raising, the exception of a failed fetch is returned for that user.
+    """
+    semaphore = asyncio.Semaphore(OWNED_GAMES_CONCURRENCY)
+
+    async def get_owned_games(steam_user_id: int) -> dict[int, SteamGameInfo]:
+        async with semaphore:
+            return await get_owned_steam_games(steam_user_id)
 
-        payload = await response.json()
-        games = payload.get("response", {}).get("games", None)  # type: list
-        if games is None:
-            raise NoAccessException(f"Could not fetch any games for Steam user <https://steamcommunity.com/profiles/{steam_user_id}>. Ensure your profile is public.")
+    results = await asyncio.gather(*[get_owned_games(steam_user_id) for steam_user_id in steam_user_ids], return_exceptions=True)
+    return dict(zip(steam_user_ids, results))
 
-        return {game["appid"]: SteamGameInfo(game) for game in games}
+
+async def fetch_owned_steam_games(steam_user_id: int) -> dict[int, SteamGameInfo]:
+    params = {
+        "key": STEAM_WEB_API_KEY,
+        "steamid": steam_user_id,
+    }
+
+    response = await http_request("GET", STEAM_GET_OWNED_GAMES_ENDPOINT, params=params)
+    if response.status == 400:
+        raise UserNotFoundException(f"Could not find Steam user <https://steamcommunity.com/profiles/{steam_user_id}>.")
+    try:
+        response.raise_for_status()
+    except Exception as e:
+        raise ApiException(f"Failed to fetch games for Steam user ID. {response.text()} {e}", e)
+
+    payload = response.json()
+    games = payload.get("response", {}).get("games", None)  # type: list
+    if games is None:
+        raise NoAccessException(f"Could not fetch any games for Steam user <https://steamcommunity.com/profiles/{steam_user_id}>. Ensure your profile is public.")
+
+    return {game["appid"]: SteamGameInfo(game) for game in games}
 
 
 def update_database_games_with_steam_user_data(db_session: Session, server_id: int, user_id: int, steam_games: dict[int, SteamGameInfo]) -> None:
+    update_database_games_with_steam_users_data(db_session, server_id, {user_id: steam_games})
+
+
+def update_database_games_with_steam_users_data(db_session: Session, server_id: int, owned_games_by_user_id: dict[int, dict[int, SteamGameInfo]]) -> bool:
+    """
+    Saves which of the server's games the users own and have played, using one query for the existing data and bulk
+    statements for the changes. Known values are only changed when Steam shows that a game has since been bought or played.
+    Returns whether anything changed.
+    """
     games = (
-        db_session.query(Game)
+        db_session.query(Game.id, Game.steam_id)
             .filter(Game.server_id == server_id)
+            .filter(Game.steam_id.isnot(None))
+            .all()
+    )
+    game_user_datas = (
+        db_session.query(GameUserData.game_id, GameUserData.user_id, GameUserData.owned, GameUserData.played_before)
+            .filter(GameUserData.server_id == server_id)
+            .filter(GameUserData.user_id.in_(owned_games_by_user_id.keys()))
             .all()
-    )  # type: list[Game]
+    )
+    existing_data = {(game_id, user_id): (owned, played_before) for game_id, user_id, owned, played_before in game_user_datas}
+
+    new_rows = []
+    changed_rows = []
+    for user_id, owned_steam_games in owned_games_by_user_id.items():
+        for game_id, game_steam_id in games:
+            owned = game_steam_id in owned_steam_games
+            played_before = owned and owned_steam_games[game_steam_id].playtime >= PLAYED_BEFORE_MINUTES_THRESHOLD
+            row = {"server_id": server_id, "game_id": game_id, "user_id": user_id}
+
+            if (game_id, user_id) not in existing_data:
+                new_rows.append({**row, "owned": owned, "played_before": played_before})
+                continue
+
+            old_owned, old_played_before = existing_data[(game_id, user_id)]
+            new_owned = owned if old_owned is None else old_owned or owned
+            new_played_before = played_before if old_played_before is None else old_played_before or played_before
+            if (new_owned, new_played_before) != (old_owned, old_played_before):
+                changed_rows.append({**row, "owned": new_owned, "played_before": new_played_before})
+
+    if len(new_rows) > 0:
+        db_session.execute(insert(GameUserData), new_rows)
+    if len(changed_rows) > 0:
+        db_session.execute(update(GameUserData), changed_rows)
+    return len(new_rows) > 0 or len(changed_rows) > 0
+
+
+async def sync_steam_libraries() -> set[int]:
+    """
+    Refreshes the Steam libraries of all members that linked their Steam account, and saves what they own and played.
+    Returns the IDs of the servers that had any change.
+    """
+    def get_server_members(db_session: Session) -> list[ServerMember]:
+        return (
+            db_session.query(ServerMember)
+                .filter(ServerMember.steam_id.isnot(None))
+                .all()
+        )
+
+    server_members = await run_in_db_session(get_server_members)
+    owned_games_by_steam_id = await get_owned_steam_games_of_users(list(set(member.steam_id for member in server_members)))
+
+    owned_games_by_server_id = {}   # type: dict[int, dict[int, dict[int, SteamGameInfo]]]
+    failed_steam_ids = set()
+    for member in server_members:
+        owned_games = owned_games_by_steam_id[member.steam_id]
+        if isinstance(owned_games, BaseException):
+            failed_steam_ids.add(member.steam_id)
+            continue
+        owned_games_by_server_id.setdefault(member.server_id, {})[member.user_id] = owned_games
+
+    # Save each server in its own transaction, so no write transaction is held open for long
+    changed_server_ids = set()
+    failed_server_ids = set()
+    for server_id, owned_games_by_user_id in owned_games_by_server_id.items():
+        try:
+            if await run_in_db_session(update_database_games_with_steam_users_data, server_id, owned_games_by_user_id):
+                changed_server_ids.add(server_id)
+        except Exception as e:
+            # Keep syncing the other servers
+            log(f"Failed to save the Steam libraries of server {server_id}: {e!r}")
+            failed_server_ids.add(server_id)
 
-    for game in games:
-        update_database_game_user_data(db_session, server_id, game.id, user_id, game.steam_id, steam_games)
+    log(f"Synced {len(owned_games_by_steam_id)} Steam libraries, {len(failed_steam_ids)} of them failed. "
+        f"{len(changed_server_ids)} servers changed, {len(failed_server_ids)} failed to save")
+    return changed_server_ids
 
 
 def update_database_game_user_data(db_session: Session, server_id: int, game_id: int, user_id: int, game_steam_id: int, owned_steam_games: dict[int, SteamGameInfo]) -> None:
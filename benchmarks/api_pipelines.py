@@ -0,0 +1,216 @@
+"""
+Times the pipelines that call external APIs against local stand-ins, on synthetic servers in a throwaway SQLite database.
+Run with: python -m benchmarks.api_pipelines --latency 0.05 --jitter 0.05 --error-rate 0.02 --rate-limit-rate 0.01
+Record real responses to replay later with: python -m benchmarks.api_pipelines --recordings recordings --record
+The stand-ins don't need real API keys, so placeholders are used for the ones missing from the environment and .env.
+Recording needs the real keys.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Awaitable
+
+import discord
+from discord.ext.commands import Bot
+from sqlalchemy import update, delete
+
+from benchmarks.environment import use_placeholder_environment
+
+# The bot reads its keys when its modules are imported, so fill in the missing ones before importing them
+use_placeholder_environment()
+
+import apis.steam_cache
+import apis.steam_catalog
+import database.db as db
+from apis.igdb import get_multiplayer_info_from_igdb, backfill_igdb_multiplayer_info, IGDB_RATE_LIMITER
+from apis.steam import search_steam_for_game, get_steam_game_price, update_database_steam_prices, STEAM_STORE_RATE_LIMITER
+from apis.resilience import get_api_metrics_summary
+from apis.steam_catalog import update_steam_catalog
+from apis.steam_web import get_owned_steam_games_of_users, sync_steam_libraries, _owned_games_cache
+from benchmarks.api_stand_ins import ApiStandIns, StandInConfig, STEAM_APP_ID_OFFSET
+from benchmarks.backlog_rendering import generate_server
+from database.models import FreeGame, FreeGameSubscriber, Game, IgdbGame, ServerMember, SteamApp, SteamCatalogApp
+from services.free_games import check_free_to_keep_games
+from shared.exceptions import ApiException
+
+LINKED_STEAM_ACCOUNT_RATIO = 0.5
+
+
+def link_steam_accounts(rng: random.Random) -> None:
+    with db.db_session_scope() as db_session:
+        members = db_session.query(ServerMember).all()     # type: list[ServerMember]
+        for member in members:
+            if rng.random() < LINKED_STEAM_ACCOUNT_RATIO:
+                member.steam_id = 76_561_197_960_000_000 + member.user_id
+
+
+def add_free_game_subscribers(count: int) -> None:
+    with db.db_session_scope() as db_session:
+        for user_id in range(1, count + 1):
+            db_session.add(FreeGameSubscriber(user_id=user_id))
+
+
+def clear_api_caches() -> None:
+    _owned_games_cache.clear()
+    with db.db_session_scope() as db_session:
+        db_session.execute(delete(SteamApp))
+        db_session.execute(delete(IgdbGame))
+
+
+async def add_game_enrichment(game_name: str, bot: Bot) -> None:
+    """
+    Retrieves everything /add retrieves from the APIs for a new game, in the same order.
+    """
+    async def add_steam_info():
+        steam_game_info = await search_steam_for_game(game_name)
+        if steam_game_info is None or "id" not in steam_game_info:
+            return
+
+        def get_steam_ids(db_session) -> list[int]:
+            return [steam_id for steam_id, in db_session.query(ServerMember.steam_id).filter(ServerMember.server_id == 1, ServerMember.steam_id.isnot(None))]
+
+        libraries_task = asyncio.create_task(get_owned_steam_games_of_users(await db.run_in_db_session(get_steam_ids)))
+        try:
+            await get_steam_game_price(steam_game_info["id"])
+        except ApiException:
+            pass
+        await libraries_task
+
+    await asyncio.gather(add_steam_info(), get_multiplayer_info_from_igdb(bot, game_name))
+
+
+async def reset_multiplayer_info() -> None:
+    def reset(db_session):
+        db_session.execute(update(Game).values(player_count=None))
+
+    await db.run_in_db_session(reset)
+
+
+async def benchmark(name: str, function: Callable[[], Awaitable], reset: Callable[[], Awaitable], stand_ins: ApiStandIns,
+                    iterations: int, cold: bool) -> str:
+    durations = []
+    request_counts = []
+    for _ in range(iterations):
+        if cold:
+            clear_api_caches()
+            await reset()
+
+        requests_before = stand_ins.stats.requests
+        start = time.perf_counter()
+        await function()
+        durations.append((time.perf_counter() - start) * 1000)
+        request_counts.append(stand_ins.stats.requests - requests_before)
+
+    durations.sort()
+    p50 = statistics.median(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    mode = "cold" if cold else "warm"
+    return f"{name:<20} {mode:<5} {p50:10.1f} {p95:10.1f} {durations[-1]:10.1f} {statistics.mean(request_counts):10.1f}"
+
+
+async def run_benchmarks(stand_ins: ApiStandIns, iterations: int) -> None:
+    bot = Bot(command_prefix="!", intents=discord.Intents.default())
+    # Logs in to the Discord stand-in, so errors and notifications can be sent
+    await bot.login("stand-in")
+    game_counter = iter(range(1, 1_000_000))
+
+    async def no_reset():
+        pass
+
+    async def clear_steam_catalog():
+        apis.steam_catalog._catalog_index = None
+        with db.db_session_scope() as db_session:
+            db_session.execute(delete(SteamCatalogApp))
+
+    async def clear_free_games():
+        with db.db_session_scope() as db_session:
+            db_session.execute(delete(FreeGame))
+
+    # Half of the added games are in the Steam catalog, the others have to be searched for
+    def get_game_name() -> str:
+        number = next(game_counter)
+        return f"Synthetic game {STEAM_APP_ID_OFFSET + number}" if number % 2 == 0 else f"Benchmark game {number}"
+
+    pipelines = {
+        "steam catalog": (update_steam_catalog, clear_steam_catalog),
+        "price refresh": (update_database_steam_prices, no_reset),
+        "add enrichment": (lambda: add_game_enrichment(get_game_name(), bot), no_reset),
+        "free games job": (lambda: check_free_to_keep_games(bot), clear_free_games),
+        "steam library sync": (sync_steam_libraries, no_reset),
+        "igdb backfill": (backfill_igdb_multiplayer_info, reset_multiplayer_info),
+    }
+
+    print(f"{'pipeline':<20} {'cache':<5} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'requests':>10}")
+    for name, (function, reset) in pipelines.items():
+        for cold in [True, False]:
+            print(await benchmark(name, function, reset, stand_ins, iterations, cold))
+
+    await bot.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    if not args.rate_limits:
+        # Only measure the pipelines themselves, instead of how long they wait for the rate limits
+        for rate_limiter in [STEAM_STORE_RATE_LIMITER, IGDB_RATE_LIMITER]:
+            rate_limiter.rate = rate_limiter.capacity = rate_limiter.tokens = 1_000_000
+
+    config = StandInConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed)
+    stand_ins = ApiStandIns(config, args.recordings, args.record)
+    await stand_ins.start()
+    stand_ins.install()
+    try:
+        await run_benchmarks(stand_ins, args.iterations)
+    finally:
+        await stand_ins.close()
+    print(stand_ins.stats)
+    # All stand-ins share one host, so their requests are guarded and measured together
+    print(get_api_metrics_summary())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the API pipelines against local stand-ins.")
+    parser.add_argument("--games", type=int, default=300, help="Amount of games per server.")
+    parser.add_argument("--members", type=int, default=25, help="Amount of members per server.")
+    parser.add_argument("--servers", type=int, default=1, help="Amount of servers in the database.")
+    parser.add_argument("--subscribers", type=int, default=10, help="Amount of users notified of free games.")
+    parser.add_argument("--iterations", type=int, default=5, help="Amount of timed calls per pipeline.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every response is delayed by.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum extra random delay of every response.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance that a request fails with a 503.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Chance that a request gets a 429.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Seconds 429 responses ask to wait.")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the real client-side rate limits.")
+    parser.add_argument("--recordings", help="Directory with recorded responses to replay.")
+    parser.add_argument("--record", action="store_true", help="Forward requests to the real APIs and record the responses.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.record and args.recordings is None:
+        parser.error("--record requires --recordings")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the whole bot at a throwaway database and banner cache
+        engine = db.create_database_engine(os.path.join(directory, "benchmark.db"))
+        db.engine = engine
+        db.SessionMaker.configure(bind=engine)
+        db.BaseModel.metadata.create_all(engine)
+        apis.steam_cache.STEAM_BANNER_DIRECTORY = os.path.join(directory, "steam_banners")
+
+        rng = random.Random(args.seed)
+        for server_id in range(1, args.servers + 1):
+            generate_server(server_id, args.games, args.members, 0.3, rng)
+        link_steam_accounts(rng)
+        add_free_game_subscribers(args.subscribers)
+
+        print(f"{args.servers} server(s), {args.games} games x {args.members} members, latency {args.latency}s, "
+              f"error rate {args.error_rate}, rate limit rate {args.rate_limit_rate}, {args.iterations} iterations")
+        asyncio.run(run(args))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+Local stand-ins for Steam, IGDB, IsThereAnyDeal and Discord's REST API, so the API pipelines can be timed without the
+network. Recorded responses are replayed when a request matches one, and deterministic synthetic responses are generated
+otherwise. Latency, errors and rate limits can be injected into every response.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiohttp
+import discord.http
+from aiohttp import web
+
+import apis.free_games
+import apis.igdb
+import apis.steam
+import apis.steam_catalog
+import apis.steam_web
+
+# Modules whose endpoint constants are pointed at the stand-ins
+API_MODULES = [apis.steam, apis.steam_catalog, apis.steam_web, apis.igdb, apis.free_games]
+DISCORD_API_BASE = discord.http.Route.BASE
+
+# Query parameters and response fields that are left out of recordings, as they contain credentials
+SECRET_PARAMS = {"key", "client_id", "client_secret"}
+SECRET_FIELDS = {"access_token"}
+
+OWNED_GAMES_PER_USER = 300
+FREE_GAMES_COUNT = 15
+STEAM_APP_ID_OFFSET = 100_000
+STEAM_CATALOG_SIZE = 20_000
+
+
+@dataclass
+class StandInConfig:
+    # Seconds added to every response, plus a random amount up to the jitter
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Chances that a request gets a 503 error or a 429 rate limit response
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+
+
+@dataclass
+class StandInStats:
+    requests: int = 0
+    replayed: int = 0
+    synthetic: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    requests_by_host: dict[str, int] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        hosts = ", ".join(f"{host} {count}" for host, count in sorted(self.requests_by_host.items()))
+        return f"{self.requests} requests ({self.replayed} replayed, {self.synthetic} synthetic, " \
+               f"{self.errors} errors, {self.rate_limited} rate limited): {hosts}"
+
+
+def get_recording_key(method: str, host: str, path: str, query: dict, body: str) -> str:
+    query = {name: value for name, value in sorted(query.items()) if name not in SECRET_PARAMS}
+    return json.dumps([method, host, path, query, body])
+
+
+class ApiStandIns:
+    """
+    A local server that answers requests for http://127.0.0.1:{port}/{original host}/{original path}.
+    In record mode, requests are forwarded to the real APIs and their responses are saved to the recordings directory.
+    """
+
+    def __init__(self, config: StandInConfig, recordings_directory: Optional[str] = None, record=False) -> None:
+        super().__init__()
+        self.config = config
+        self.recordings_directory = recordings_directory
+        self.record = record
+        self.stats = StandInStats()
+        self.base_url = None    # type: Optional[str]
+        self._rng = random.Random(config.seed)
+        self._recordings = {}   # type: dict[str, dict]
+        self._recordings_by_path = {}   # type: dict[str, dict]
+        self._runner = None     # type: Optional[web.AppRunner]
+        self._original_endpoints = {}   # type: dict[tuple, str]
+        self._real_session = None   # type: Optional[aiohttp.ClientSession]
+
+    async def start(self) -> None:
+        self._load_recordings()
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_route("*", "/{host}/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        if self.record:
+            self._real_session = aiohttp.ClientSession()
+
+    async def close(self) -> None:
+        self.uninstall()
+        if self._real_session is not None:
+            await self._real_session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def install(self) -> None:
+        """
+        Points the API modules and discord.py at the stand-ins.
+        """
+        for module in API_MODULES:
+            for name, value in vars(module).items():
+                if name.endswith("_ENDPOINT") and isinstance(value, str) and value.startswith("https://"):
+                    self._original_endpoints[(module, name)] = value
+                    setattr(module, name, self.to_local_url(value))
+        discord.http.Route.BASE = self.to_local_url(DISCORD_API_BASE)
+
+    def uninstall(self) -> None:
+        for (module, name), value in self._original_endpoints.items():
+            setattr(module, name, value)
+        self._original_endpoints.clear()
+        discord.http.Route.BASE = DISCORD_API_BASE
+
+    def to_local_url(self, url: str) -> str:
+        return f"{self.base_url}/{url.removeprefix('https://')}"
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        host = request.match_info["host"]
+        path = "/" + request.match_info["path"]
+        body = await request.text()
+        self.stats.requests += 1
+        self.stats.requests_by_host[host] = self.stats.requests_by_host.get(host, 0) + 1
+
+        if self.record:
+            return await self._forward(request, host, path, body)
+
+        delay = self.config.latency + self._rng.random() * self.config.jitter
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self._rng.random()
+        if roll < self.config.rate_limit_rate:
+            self.stats.rate_limited += 1
+            # discord.py treats rate limits without a Via header as a Cloudflare ban
+            return json_response({"message": "Rate limited", "retry_after": self.config.retry_after, "global": False},
+                                 status=429, headers={"Retry-After": str(self.config.retry_after), "Via": "1.1 stand-in"})
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.stats.errors += 1
+            return web.Response(status=503, text="Service unavailable (injected)")
+
+        recording = self._recordings.get(get_recording_key(request.method, host, path, dict(request.query), body))
+        if recording is not None:
+            self.stats.replayed += 1
+            return self._replay(recording)
+
+        response = synthesize_response(request.method, host, path, dict(request.query), body, self.base_url)
+        # Endpoints without synthetic responses get the first recording of that endpoint instead
+        recording = self._recordings_by_path.get(f"{request.method} {host}{path}")
+        if response.status == 404 and recording is not None:
+            self.stats.replayed += 1
+            return self._replay(recording)
+
+        self.stats.synthetic += 1
+        return response
+
+    def _replay(self, recording: dict) -> web.Response:
+        body = recording["body"]
+        # Point URLs in the response, like banners, at the stand-ins as well
+        body = body.replace("https://", f"{self.base_url}/").replace("https:\\/\\/", self.base_url.replace("/", "\\/") + "\\/")
+        return web.Response(status=recording["status"], body=body.encode("utf-8"), content_type=recording["content_type"])
+
+    async def _forward(self, request: web.Request, host: str, path: str, body: str) -> web.Response:
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in {"host", "content-length"}}
+        async with self._real_session.request(request.method, f"https://{host}{path}", params=request.query,
+                                              headers=headers, data=body or None) as response:
+            response_body = await response.read()
+            content_type = response.content_type
+
+        # Binary responses like banners are not recorded, they get synthetic stand-ins instead
+        if not content_type.startswith("image/"):
+            self._save_recording(host, {
+                "key": get_recording_key(request.method, host, path, dict(request.query), body),
+                "method": request.method,
+                "path": f"{host}{path}",
+                "status": response.status,
+                "content_type": content_type,
+                "body": self._redact(response_body.decode("utf-8", errors="replace"), content_type),
+            })
+        return web.Response(status=response.status, body=response_body, content_type=content_type)
+
+    @staticmethod
+    def _redact(body: str, content_type: str) -> str:
+        if content_type != "application/json":
+            return body
+        payload = json.loads(body)
+        if isinstance(payload, dict):
+            payload = {name: "recorded" if name in SECRET_FIELDS else value for name, value in payload.items()}
+        return json.dumps(payload)
+
+    def _load_recordings(self) -> None:
+        if self.recordings_directory is None or not os.path.isdir(self.recordings_directory):
+            return
+        for filename in sorted(os.listdir(self.recordings_directory)):
+            if not filename.endswith(".jsonl"):
+                continue
+            with open(os.path.join(self.recordings_directory, filename), encoding="utf-8") as f:
+                for line in f:
+                    recording = json.loads(line)
+                    self._recordings[recording["key"]] = recording
+                    self._recordings_by_path.setdefault(f"{recording['method']} {recording['path']}", recording)
+
+    def _save_recording(self, host: str, recording: dict) -> None:
+        os.makedirs(self.recordings_directory, exist_ok=True)
+        with open(os.path.join(self.recordings_directory, f"{host}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(recording) + "\n")
+
+
+def json_response(data, status: int = 200, headers: Optional[dict] = None) -> web.Response:
+    # discord.py only parses JSON when the content type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode("utf-8"), status=status, headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+def stable_number(*values) -> int:
+    # Python's hash() is randomized per process, which would make the synthetic data differ between runs
+    return int(hashlib.sha1(repr(values).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def synthesize_response(method: str, host: str, path: str, query: dict, body: str, base_url: str) -> web.Response:
+    if host == "store.steampowered.com" and path == "/api/appdetails":
+        steam_ids = [int(steam_id) for steam_id in query.get("appids", "").split(",") if steam_id]
+        price_only = query.get("filters") == "price_overview"
+        return json_response({
+            str(steam_id): {"success": True, "data": synthesize_steam_app(steam_id, price_only, base_url)} for steam_id in steam_ids
+        })
+
+    if host == "store.steampowered.com" and path == "/api/storesearch/":
+        term = query.get("term", "")
+        return json_response({"total": 1, "items": [{"type": "app", "name": term, "id": STEAM_APP_ID_OFFSET + stable_number(term) % 100_000}]})
+
+    if host.endswith("steamstatic.com"):
+        return web.Response(body=bytes(stable_number(path) % 256 for _ in range(40_000)), content_type="image/jpeg")
+
+    if host == "api.steampowered.com" and path.startswith("/IPlayerService/GetOwnedGames"):
+        steam_user_id = int(query.get("steamid", 0))
+        rng = random.Random(steam_user_id)
+        steam_ids = rng.sample(range(STEAM_APP_ID_OFFSET, STEAM_APP_ID_OFFSET + 2000), OWNED_GAMES_PER_USER)
+        games = [{"appid": steam_id, "playtime_forever": rng.choice([0, 30, 600, 6000])} for steam_id in steam_ids]
+        return json_response({"response": {"game_count": len(games), "games": games}})
+
+    if host == "api.steampowered.com" and path.startswith("/IStoreService/GetAppList"):
+        last_app_id = max(int(query.get("last_appid", 0)), STEAM_APP_ID_OFFSET - 1)
+        max_results = int(query.get("max_results", 10_000))
+        app_ids = range(last_app_id + 1, min(last_app_id + 1 + max_results, STEAM_APP_ID_OFFSET + STEAM_CATALOG_SIZE))
+        modified_since = int(query.get("if_modified_since", 0))
+        apps = [{"appid": app_id, "name": f"Synthetic game {app_id}", "last_modified": 1_700_000_000 + app_id} for app_id in app_ids]
+        apps = [app for app in apps if app["last_modified"] > modified_since]
+        have_more_results = len(app_ids) > 0 and app_ids[-1] < STEAM_APP_ID_OFFSET + STEAM_CATALOG_SIZE - 1
+        return json_response({"response": {"apps": apps, "have_more_results": have_more_results, "last_appid": app_ids[-1] if apps else last_app_id}})
+
+    if host == "api.steampowered.com" and path.startswith("/ISteamUser/ResolveVanityURL"):
+        return json_response({"response": {"success": 1, "steamid": str(stable_number(query.get("vanityurl")))}})
+
+    if host == "id.twitch.tv":
+        return json_response({"access_token": "stand-in", "expires_in": 5_000_000, "token_type": "bearer"})
+
+    if host == "api.igdb.com" and path == "/v4/games":
+        return json_response(synthesize_igdb_games(re.findall(r'search "((?:[^"\\]|\\.)*)"', body)[0]))
+
+    if host == "api.igdb.com" and path == "/v4/multiquery":
+        queries = re.findall(r'query games "([^"]*)" \{ search "((?:[^"\\]|\\.)*)"', body)
+        return json_response([{"name": label, "result": synthesize_igdb_games(search)} for label, search in queries])
+
+    if host == "api.isthereanydeal.com":
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 20))
+        indices = range(offset, min(offset + limit, FREE_GAMES_COUNT))
+        return json_response({
+            "nextOffset": offset + len(indices),
+            "hasMore": offset + len(indices) < FREE_GAMES_COUNT,
+            "list": [synthesize_free_game(index) for index in indices],
+        })
+
+    if host == "discord.com":
+        return synthesize_discord_response(method, path, body)
+
+    return json_response({"message": f"No stand-in for {method} {host}{path}"}, status=404)
+
+
+def synthesize_steam_app(steam_id: int, price_only: bool, base_url: str) -> dict | list:
+    number = stable_number(steam_id)
+    is_free = number % 10 == 0
+    price_initial = [999, 1999, 2999, 5999][number % 4]
+    price_overview = {
+        "currency": "EUR",
+        "initial": price_initial,
+        # Prices change every hour, so refreshes find some changed prices
+        "final": price_initial // 2 if stable_number(steam_id, int(time.time() // 3600)) % 5 == 0 else price_initial,
+        "discount_percent": 0,
+    }
+    if price_only:
+        # Steam returns an empty list for apps without a price
+        return [] if is_free else {"price_overview": price_overview}
+
+    steam_game_data = {
+        "type": "game",
+        "name": f"Synthetic game {steam_id}",
+        "steam_appid": steam_id,
+        "is_free": is_free,
+        "header_image": f"{base_url}/shared.akamai.steamstatic.com/store_item_assets/steam/apps/{steam_id}/header.jpg",
+        "genres": [{"id": "70", "description": "Early Access"}] if number % 7 == 0 else [{"id": "1", "description": "Action"}],
+        "release_date": {"coming_soon": number % 11 == 0, "date": ""},
+    }
+    if not is_free:
+        steam_game_data["price_overview"] = price_overview
+    return steam_game_data
+
+
+def synthesize_igdb_games(search: str) -> list[dict]:
+    number = stable_number(search.lower())
+    if number % 8 == 0:
+        return []
+    game = {"id": number % 1_000_000, "name": search.replace('\\"', '"')}
+    if number % 3 != 0:
+        game["multiplayer_modes"] = [{
+            "id": number % 1_000_000,
+            "campaigncoop": number % 2 == 0,
+            "offlinecoop": number % 5 == 0,
+            "offlinecoopmax": 2 if number % 5 == 0 else 0,
+            "onlinecoopmax": [0, 2, 4][number % 3],
+            "onlinemax": [0, 4, 8, 16][number % 4],
+        }]
+    return [game]
+
+
+def synthesize_free_game(index: int) -> dict:
+    # The deals change every day, like the real ones
+    day = int(time.time() // 86400)
+    deal_number = stable_number(day, index)
+    return {
+        "id": f"018d{deal_number:08x}",
+        "slug": f"synthetic-deal-{deal_number}",
+        "title": f"Synthetic free game {deal_number}",
+        "type": "game",
+        "deal": {
+            "shop": {"id": 16, "name": "Epic Game Store"},
+            "price": {"amount": 0, "currency": "EUR"},
+            "regular": {"amount": 19.99, "currency": "EUR"},
+            "cut": 100,
+            "expiry": "2099-01-01T00:00:00+00:00",
+            "url": f"https://itad.link/{deal_number}/",
+        },
+    }
+
+
+def synthesize_discord_user(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "global_name": f"User {user_id}", "discriminator": "0", "avatar": None}
+
+
+def synthesize_discord_message(channel_id: str, message_id: int, body: str) -> dict:
+    payload = json.loads(body) if body.startswith("{") else {}
+    return {
+        "id": str(message_id),
+        "channel_id": channel_id,
+        "author": synthesize_discord_user(1),
+        "content": payload.get("content") or "",
+        "embeds": payload.get("embeds") or [],
+        "attachments": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "type": 0,
+        "flags": 0,
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+    }
+
+
+def synthesize_discord_response(method: str, path: str, body: str) -> web.Response:
+    path = path.removeprefix("/api/v10")
+    if method == "DELETE":
+        return web.Response(status=204)
+
+    if path == "/users/@me":
+        return json_response({**synthesize_discord_user(1), "bot": True})
+
+    if path == "/oauth2/applications/@me":
+        return json_response({
+            "id": "1", "name": "Stand-in", "description": "", "icon": None, "bot_public": True, "bot_require_code_grant": False,
+            "verify_key": "", "owner": synthesize_discord_user(1), "team": None, "flags": 0,
+        })
+
+    if path == "/users/@me/channels":
+        recipient_id = json.loads(body).get("recipient_id", 0)
+        return json_response({"id": str(stable_number("dm", recipient_id) + 1), "type": 1, "recipients": [synthesize_discord_user(recipient_id)]})
+
+    match = re.fullmatch(r"/users/(\d+)", path)
+    if match is not None:
+        return json_response(synthesize_discord_user(int(match.group(1))))
+
+    match = re.fullmatch(r"/channels/(\d+)/messages(?:/(\d+))?", path)
+    if match is not None:
+        message_id = int(match.group(2)) if match.group(2) else stable_number(path, body, time.time())
+        return json_response(synthesize_discord_message(match.group(1), message_id, body))
+
+    return json_response({"message": f"No stand-in for {method} {path}", "code": 0}, status=404)
@@ -0,0 +1,190 @@
+"""
+Times the backlog's hot rendering paths on synthetic servers in a throwaway SQLite database.
+Run with: python -m benchmarks.backlog_rendering --games 300 --members 25 --density 0.6
+Placeholders are used for the API keys missing from the environment and .env, as no APIs are called.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable, Awaitable
+
+from sqlalchemy import event, insert
+
+from benchmarks.environment import use_placeholder_environment
+
+# The bot reads its keys when its modules are imported, so fill in the missing ones before importing them
+use_placeholder_environment()
+
+import database.db as db
+from database.models import Game, GameUserData, LiveMessage, LiveMessageType, ReleaseState, Server, ServerMember, User
+from database.server_cache import SNAPSHOT_PARTS, invalidate_server_cache, load_server_snapshot
+from embeds.affinity import generate_affinity_embed
+from embeds.hall_of_game import generate_hog_embed
+from embeds.list import generate_list_embeds, generate_unvoted_embed
+from embeds.owned_games import generate_owned_games_embed
+from embeds.utils import get_game_embed_field
+from shared.game_autocomplete import autocomplete_game
+
+FINISHED_GAME_RATIO = 0.25
+
+
+class StatementCounter:
+    """
+    Counts the SQL statements executed on an engine.
+    """
+
+    def __init__(self, engine) -> None:
+        super().__init__()
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def generate_server(server_id: int, game_count: int, member_count: int, vote_density: float, rng: random.Random) -> None:
+    """
+    Fills the database with a server whose members voted on each game with the given probability.
+    """
+    user_ids = [server_id * 100_000 + index for index in range(member_count)]
+    games = []
+    game_user_data = []
+    for game_id in range(1, game_count + 1):
+        finished = rng.random() < FINISHED_GAME_RATIO
+        price_original = rng.choice([None, 0, 9.99, 19.99, 59.99])
+        price_current = None if price_original is None else rng.choice([price_original, price_original / 2])
+        games.append({
+            "server_id": server_id,
+            "id": game_id,
+            "name": f"Synthetic game {game_id}",
+            "submitter": "benchmark",
+            "notes": ["Note"] if rng.random() < 0.1 else [],
+            "player_count": rng.choice([None, 1, 2, 4, 8]),
+            "steam_id": rng.choice([None, 100_000 + game_id]),
+            "price_current": price_current,
+            "price_original": price_original,
+            "local": rng.random() < 0.2,
+            "release_state": rng.choice(list(ReleaseState)),
+            "finished": finished,
+            "finished_timestamp": time.time() if finished else None,
+        })
+
+        for user_id in user_ids:
+            if rng.random() >= vote_density:
+                continue
+            game_user_data.append({
+                "server_id": server_id,
+                "game_id": game_id,
+                "user_id": user_id,
+                "vote": rng.randint(0, 10),
+                "owned": rng.choice([None, True, False]),
+                "played_before": rng.choice([None, True, False]),
+                "enjoyment_score": rng.randint(0, 10) if finished else None,
+            })
+
+    with db.db_session_scope() as db_session:
+        db_session.add(Server(id=server_id))
+        db_session.execute(insert(User), [
+            {"id": user_id, "username": f"user{user_id}", "global_name": f"User {user_id}"} for user_id in user_ids
+        ])
+        db_session.execute(insert(ServerMember), [
+            {"user_id": user_id, "server_id": server_id, "alias": f"Alias {user_id}" if rng.random() < 0.3 else None} for user_id in user_ids
+        ])
+        db_session.execute(insert(Game), games)
+        db_session.execute(insert(GameUserData), game_user_data)
+        db_session.add(LiveMessage(
+            server_id=server_id,
+            channel_id=str(server_id),
+            message_id=str(server_id),
+            message_type=LiveMessageType.LIST,
+            selected_user_ids=user_ids[:4],
+        ))
+
+
+async def benchmark(name: str, function: Callable[[], Awaitable], counter: StatementCounter, iterations: int, cold: bool) -> str:
+    durations = []
+    statement_counts = []
+    for _ in range(iterations):
+        if cold:
+            # Force every part of the server snapshots to be reloaded
+            for part in SNAPSHOT_PARTS:
+                invalidate_server_cache(None, part)
+
+        counter.count = 0
+        start = time.perf_counter()
+        await function()
+        durations.append((time.perf_counter() - start) * 1000)
+        statement_counts.append(counter.count)
+
+    durations.sort()
+    p50 = statistics.median(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    mode = "cold" if cold else "warm"
+    return f"{name:<22} {mode:<5} {p50:9.2f} {p95:9.2f} {p99:9.2f} {durations[-1]:9.2f} {statistics.mean(statement_counts):9.1f}"
+
+
+async def run_benchmarks(server_id: int, iterations: int, counter: StatementCounter) -> None:
+    snapshot = await load_server_snapshot(server_id)
+    member_ids = snapshot.get_member_ids()
+    selected_user_ids = member_ids[:4]
+    unfinished_games = snapshot.get_games(finished=False)
+    autocomplete = autocomplete_game()
+    interaction = SimpleNamespace(guild=SimpleNamespace(id=server_id))
+
+    async def game_embed_fields():
+        field_snapshot = await load_server_snapshot(server_id)
+        for game in unfinished_games[:25]:
+            get_game_embed_field(field_snapshot, game)
+
+    functions = {
+        "list (all members)": lambda: generate_list_embeds(server_id, []),
+        "list (4 selected)": lambda: generate_list_embeds(server_id, selected_user_ids),
+        "hall of game": lambda: generate_hog_embed(server_id),
+        "owned games": lambda: generate_owned_games_embed(server_id),
+        "unvoted": lambda: generate_unvoted_embed(server_id),
+        "affinity": lambda: generate_affinity_embed(server_id, member_ids[0]),
+        "game embed fields (25)": game_embed_fields,
+        "autocomplete": lambda: autocomplete(interaction, "game 1"),
+    }
+
+    print(f"{'benchmark':<22} {'cache':<5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'SQL/call':>9}")
+    for name, function in functions.items():
+        for cold in [True, False]:
+            print(await benchmark(name, function, counter, iterations, cold))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the backlog's rendering on synthetic servers.")
+    parser.add_argument("--games", type=int, default=300, help="Amount of games per server.")
+    parser.add_argument("--members", type=int, default=25, help="Amount of members per server.")
+    parser.add_argument("--density", type=float, default=0.6, help="Chance that a member voted on a game.")
+    parser.add_argument("--servers", type=int, default=1, help="Amount of servers in the database, only the first one is timed.")
+    parser.add_argument("--iterations", type=int, default=50, help="Amount of timed calls per benchmark.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the whole bot at a throwaway database
+        engine = db.create_database_engine(os.path.join(directory, "benchmark.db"))
+        db.engine = engine
+        db.SessionMaker.configure(bind=engine)
+        db.BaseModel.metadata.create_all(engine)
+
+        rng = random.Random(args.seed)
+        for server_id in range(1, args.servers + 1):
+            generate_server(server_id, args.games, args.members, args.density, rng)
+
+        counter = StatementCounter(engine)
+        print(f"{args.servers} server(s), {args.games} games x {args.members} members, vote density {args.density}, {args.iterations} iterations")
+        asyncio.run(run_benchmarks(1, args.iterations, counter))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
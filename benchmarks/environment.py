@@ -0,0 +1,22 @@
+import os
+
+from dotenv import load_dotenv
+
+# Keys the bot reads when its modules are imported, with the placeholders used when they are not set
+PLACEHOLDER_ENVIRONMENT = {
+    "DEVELOPER_USER_ID": "1",
+    "STEAM_WEB_API_KEY": "stand-in",
+    "TWITCH_CLIENT_ID": "stand-in",
+    "TWITCH_CLIENT_SECRET": "stand-in",
+    "ITAD_API_KEY": "stand-in",
+}
+
+
+def use_placeholder_environment() -> None:
+    """
+    Fills in placeholders for the keys missing from the environment and .env, so the benchmarks run without real keys.
+    Call this before importing the bot's modules.
+    """
+    load_dotenv()
+    for variable, placeholder in PLACEHOLDER_ENVIRONMENT.items():
+        os.environ.setdefault(variable, placeholder)
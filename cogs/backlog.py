@@ -1,27 +1,32 @@
+import asyncio
 import time
+from typing import Optional, Callable
 
 import discord
 from discord import app_commands, Interaction
 from discord.ext import commands
+from sqlalchemy.orm import Session
 
-from apis.igdb import get_multiplayer_info_from_igdb
+from apis.igdb import get_multiplayer_info_from_igdb, MultiplayerInfo, apply_multiplayer_info
 from apis.steam import get_steam_game_banner, get_steam_game_price, update_game_steam_prices_fields, \
     search_steam_for_game, update_database_steam_prices
 from apis.steam_web import update_database_game_user_data, get_owned_steam_games, get_steam_user_id, \
-    update_database_games_with_steam_user_data
-from database.db import db_session_scope
+    update_database_games_with_steam_user_data, SteamGameInfo, get_owned_steam_games_of_users
+from database.db import run_in_db_session
 from database.models import ServerMember, LiveMessage, LiveMessageType, GameUserData, Game
-from database.utils import get_game, get_server_members
+from database.server_cache import load_server_snapshot
+from database.utils import get_game
 from embeds.edit_game import EditGame
 from embeds.hall_of_game import generate_hog_embed
 from embeds.list import generate_unvoted_embed, generate_filter_embed, generate_list_embeds
 from embeds.list_view import ListView
 from embeds.owned_games import generate_owned_games_embed
 from embeds.unvoted_games import UnvotedGames
-from shared.exceptions import NoAccessException, GameNotFoundException
-from shared.game_autocomplete import clear_game_cache, autocomplete_game
+from shared.error_reporter import send_error_message
+from shared.exceptions import GameNotFoundException, BotException, ApiException
+from shared.game_autocomplete import autocomplete_game
 from shared.live_messages import update_live_messages, update_list, get_live_message_object, update_hall_of_game, \
-    update_all_lists
+    update_lists, delete_live_message
 from shared.logger import log
 
 
@@ -31,16 +36,16 @@ class Backlog(commands.Cog):
         self.bot = bot
 
     async def update_steam_prices(self) -> None:
-        await update_database_steam_prices()
-        await update_all_lists(self.bot)
+        changed_server_ids = await update_database_steam_prices()
+        await update_lists(self.bot, changed_server_ids)
 
     @app_commands.guild_only()
     @app_commands.command(name="update_prices", description="Retrieves the latest prices from Steam. Gets called 4 times a day automatically.")
     async def update_prices(self, interaction: Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        await update_database_steam_prices()
-        await update_all_lists(self.bot)
+        changed_server_ids = await update_database_steam_prices()
+        await update_lists(self.bot, changed_server_ids)
 
         await interaction.followup.send("Game prices updated.")
 
@@ -59,80 +64,123 @@ class Backlog(commands.Cog):
         except ValueError:
             pass
 
-        with db_session_scope() as db_session:
-            try:
-                game = get_game(db_session, server_id, game_name, finished=True)
+        def find_existing_game(db_session: Session) -> Optional[Game]:
+            for finished in [True, False]:
+                try:
+                    return get_game(db_session, server_id, game_name, finished=finished)
+                except GameNotFoundException:
+                    pass
+            return None
+
+        game = await run_in_db_session(find_existing_game)
+        if game is not None:
+            if game.finished:
                 log(f"Game already finished: {str(game.name)}")
                 await interaction.followup.send("This game has already been finished.")
-                return
-            except GameNotFoundException:
-                pass
-
-            try:
-                game = get_game(db_session, server_id, game_name)
+            else:
                 log(f"Game already added: {str(game.name)}")
                 await interaction.followup.send("This game has already been added.")
-                return
-            except GameNotFoundException:
-                last_game_id = (
-                    db_session.query(Game.id)
-                        .filter(Game.server_id == server_id)
-                        .order_by(Game.id.desc())
-                        .limit(1)
-                        .scalar()
-                )
-                game_id = (last_game_id + 1) if last_game_id is not None else 1
-                username = str(interaction.user)
-                game = Game(
-                    server_id=server_id,
-                    id=game_id,
-                    name=game_name,
-                    submitter=username
-                )
+            return
+
+        username = str(interaction.user)
+
+        def save_game(db_session: Session) -> Game:
+            last_game_id = (
+                db_session.query(Game.id)
+                    .filter(Game.server_id == server_id)
+                    .order_by(Game.id.desc())
+                    .limit(1)
+                    .scalar()
+            )
+            game = Game(
+                server_id=server_id,
+                id=(last_game_id + 1) if last_game_id is not None else 1,
+                name=game_name,
+                submitter=username,
+            )
+            db_session.add(game)
+            return game
 
+        # Save the game right away, and fill in the info from the APIs afterwards
+        game = await run_in_db_session(save_game)
+        await interaction.followup.send(f"Added game \"{game.name}\".")
+
+        def get_added_game(db_session: Session) -> Optional[Game]:
+            # The game could have been removed in the meantime, and its ID then reused by the next added game
+            saved_game = db_session.get(Game, (server_id, game.id))     # type: Optional[Game]
+            if saved_game is None or saved_game.name != game.name:
+                return None
+            return saved_game
+
+        def update_game(db_session: Session, update_function: Callable[[Game], None]):
+            saved_game = get_added_game(db_session)
+            if saved_game is not None:
+                update_function(saved_game)
+
+        async def add_steam_info():
             # Search Steam for this game and save the info
-            steam_game_info = search_steam_for_game(game_name)
-            if steam_game_info is not None and \
-                    "id" in steam_game_info:
-                game.steam_id = steam_game_info["id"]
-                game_price = await get_steam_game_price(game.steam_id)
-                update_game_steam_prices_fields(game, game_price)
-
-            # If this game has a Steam ID, for each user with a Steam ID, check if they have owned or played the game
-            if game.steam_id:
-                members = (
-                    db_session.query(ServerMember)
-                        .filter(ServerMember.server_id == server_id)
-                        .filter(ServerMember.steam_id.isnot(None))
-                        .all()
-                )   # type: list[ServerMember]
-                for member in members:
-                    try:
-                        owned_games = await get_owned_steam_games(member.steam_id)
-                        update_database_game_user_data(db_session, server_id, game.id, member.user_id, game.steam_id, owned_games)
-                    except NoAccessException as e:
-                        await interaction.followup.send(e.message)
+            steam_game_info = await search_steam_for_game(game_name)
+            if steam_game_info is None or "id" not in steam_game_info:
+                return
+            steam_id = steam_game_info["id"]
+
+            async def get_owned_games_of_members() -> dict[int, dict[int, SteamGameInfo] | Exception]:
+                snapshot = await load_server_snapshot(server_id)
+                steam_ids_by_user_id = {member.user_id: member.steam_id for member in snapshot.members if member.steam_id is not None}
+                owned_games_by_steam_id = await get_owned_steam_games_of_users(list(set(steam_ids_by_user_id.values())))
+                return {user_id: owned_games_by_steam_id[member_steam_id] for user_id, member_steam_id in steam_ids_by_user_id.items()}
 
+            # The price and the libraries of the members only need the Steam ID
+            libraries_task = asyncio.create_task(get_owned_games_of_members())
+            try:
+                try:
+                    game_price = await get_steam_game_price(steam_id)
+                except ApiException as e:
+                    # Still link the game, its price gets filled in by the next price refresh
+                    await send_error_message(self.bot, e)
+                    game_price = None
+
+                def set_steam_fields(saved_game: Game):
+                    saved_game.steam_id = steam_id
+                    update_game_steam_prices_fields(saved_game, game_price)
+
+                await run_in_db_session(update_game, set_steam_fields)
+                libraries = await libraries_task
+            finally:
+                # Don't leave the task running unawaited when anything above failed
+                if not libraries_task.done():
+                    libraries_task.cancel()
+
+            # For each user with a Steam ID, check if they have owned or played the game
+            owned_games_by_user_id = {}     # type: dict[int, dict[int, SteamGameInfo]]
+            for user_id, owned_games in libraries.items():
+                if isinstance(owned_games, BotException):
+                    await interaction.followup.send(owned_games.message)
+                elif isinstance(owned_games, BaseException):
+                    await send_error_message(self.bot, owned_games)
+                else:
+                    owned_games_by_user_id[user_id] = owned_games
+
+            def save_owned_games(db_session: Session):
+                if get_added_game(db_session) is None:
+                    return
+                for user_id, owned_games in owned_games_by_user_id.items():
+                    update_database_game_user_data(db_session, server_id, game.id, user_id, steam_id, owned_games)
+
+            await run_in_db_session(save_owned_games)
+
+        async def add_multiplayer_info():
             # Get multiplayer info from IGDB
             multiplayer_info = await get_multiplayer_info_from_igdb(self.bot, game_name)   # type: MultiplayerInfo
             if multiplayer_info is not None:
-                if multiplayer_info.max_players_online > 0:
-                    game.player_count = multiplayer_info.max_players_online
-                if multiplayer_info.max_players_offline > 0:
-                    game.local = True
-                    if multiplayer_info.max_players_online == 0:
-                        game.player_count = multiplayer_info.max_players_offline
-                if multiplayer_info.campaign_coop is False:
-                    if game.notes is None:
-                        game.notes = []
-                    game.notes.append("No co-op campaign.")
-
-            db_session.add(game)
+                await run_in_db_session(update_game, lambda saved_game: apply_multiplayer_info(saved_game, multiplayer_info))
 
-            clear_game_cache(server_id)
+        # The APIs do not depend on each other, so the slowest one determines how long this takes
+        for result in await asyncio.gather(add_steam_info(), add_multiplayer_info(), return_exceptions=True):
+            if isinstance(result, BaseException):
+                await send_error_message(self.bot, result)
 
         await update_live_messages(self.bot, server_id)
-        await interaction.followup.send(f"Added game \"{game.name}\".")
 
     @app_commands.guild_only()
     @app_commands.command(name="remove", description="Removes a game from the list.")
@@ -142,13 +190,14 @@ class Backlog(commands.Cog):
     async def remove_game(self, interaction: Interaction, game_name: str):
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
+        def remove(db_session: Session) -> Game:
             game = get_game(db_session, server_id, game_name)
 
             # Remove the game from the database
             db_session.delete(game)
+            return game
 
-            clear_game_cache(server_id)
+        game = await run_in_db_session(remove)
 
         await update_live_messages(self.bot, server_id)
         await interaction.response.send_message(f"Removed game \"{game.name}\".", ephemeral=True)
@@ -163,33 +212,40 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
-            game = get_game(db_session, server_id, game_name)
-
-            game.finished = True
-            game.finished_timestamp = time.time()
+        game = await run_in_db_session(get_game, server_id, game_name)
 
-            hog_message = await get_live_message_object(self.bot, server_id, LiveMessageType.HALL_OF_GAME)
-            if hog_message:
-                hog_channel = hog_message.channel
-            else:
-                hog_channel = interaction.channel
-
-            game_text = game.name
-            if game.steam_id is not None:
-                game_link = f"https://store.steampowered.com/app/{game.steam_id}"
-                game_text = f"[{game_text}](<{game_link}>)"     # Surround the link in <> to prevent a link embed from being added
+        hog_message = await get_live_message_object(self.bot, server_id, LiveMessageType.HALL_OF_GAME)
+        if hog_message:
+            hog_channel = hog_message.channel
+        else:
+            hog_channel = interaction.channel
 
-            # Create a thread for the game and its screenshots in the hall of game channel
-            banner_file = get_steam_game_banner(game.steam_id)
-            if banner_file is None:
-                banner_message = await hog_channel.send(game_text)
-            else:
-                banner_message = await hog_channel.send(game_text, file=banner_file)
-            await banner_message.create_thread(name=game.name)
-            await hog_channel.create_thread(name=f"{game.name} screenshots", type=discord.ChannelType.public_thread)
+        game_text = game.name
+        if game.steam_id is not None:
+            game_link = f"https://store.steampowered.com/app/{game.steam_id}"
+            game_text = f"[{game_text}](<{game_link}>)"     # Surround the link in <> to prevent a link embed from being added
 
-            clear_game_cache(server_id)
+        # Create a thread for the game and its screenshots in the hall of game channel
+        banner_file = await get_steam_game_banner(game.steam_id)
+        if banner_file is None:
+            banner_message = await hog_channel.send(game_text)
+        else:
+            banner_message = await hog_channel.send(game_text, file=banner_file)
+        await banner_message.create_thread(name=game.name)
+        await hog_channel.create_thread(name=f"{game.name} screenshots", type=discord.ChannelType.public_thread)
+
+        def mark_finished(db_session: Session) -> bool:
+            # The game could have been removed in the meantime
+            finished_game = db_session.get(Game, (server_id, game.id))    # type: Optional[Game]
+            if finished_game is None:
+                return False
+            finished_game.finished = True
+            finished_game.finished_timestamp = time.time()
+            return True
+
+        if not await run_in_db_session(mark_finished):
+            await interaction.followup.send(f"Game \"{game.name}\" was removed before it could be finished.")
+            return
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Finished game \"{game.name}\".")
@@ -218,7 +274,7 @@ class Backlog(commands.Cog):
             await interaction.followup.send("Rating must be a number between 0 and 10.")
             return
 
-        with db_session_scope() as db_session:
+        def save_rating(db_session: Session) -> Game:
             game = get_game(db_session, server_id, game_name, finished=True)
             game_user_data = db_session.get(GameUserData, (server_id, game.id, user_id))    # type: GameUserData
             if game_user_data is None:
@@ -226,6 +282,9 @@ class Backlog(commands.Cog):
                 db_session.add(game_user_data)
 
             game_user_data.enjoyment_score = score
+            return game
+
+        game = await run_in_db_session(save_rating)
 
         await update_hall_of_game(self.bot, server_id)
         await interaction.followup.send(f"Rated game \"{game.name}\" a {score}.")
@@ -244,14 +303,13 @@ class Backlog(commands.Cog):
 
         message = await interaction.followup.send(embed=hog_embed, wait=True)   # type: discord.Message
 
-        with db_session_scope() as db_session:
-            hog_live_message = LiveMessage(
-                server_id=server_id,
-                channel_id=message.channel.id,
-                message_id=message.id,
-                message_type=LiveMessageType.HALL_OF_GAME,
-            )
-            db_session.add(hog_live_message)
+        hog_live_message = LiveMessage(
+            server_id=server_id,
+            channel_id=message.channel.id,
+            message_id=message.id,
+            message_type=LiveMessageType.HALL_OF_GAME,
+        )
+        await run_in_db_session(lambda db_session: db_session.add(hog_live_message))
 
     @app_commands.guild_only()
     @app_commands.command(name="vote", description="Sets your preference for playing a game, between 0-10. Default vote is 5.")
@@ -277,7 +335,7 @@ class Backlog(commands.Cog):
             await interaction.followup.send("Score must be a number between 0 and 10.")
             return
 
-        with db_session_scope() as db_session:
+        def save_vote(db_session: Session) -> Game:
             game = get_game(db_session, server_id, game_name)
             game_user_data = db_session.get(GameUserData, (server_id, game.id, user_id))  # type: GameUserData
             if game_user_data is None:
@@ -285,6 +343,9 @@ class Backlog(commands.Cog):
                 db_session.add(game_user_data)
 
             game_user_data.vote = score
+            return game
+
+        game = await run_in_db_session(save_vote)
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Voted {score} on game \"{game.name}\".")
@@ -296,48 +357,45 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        user_ids = [member.user_id for member in get_server_members(server_id)]
+        snapshot = await load_server_snapshot(server_id)
+        user_ids = snapshot.get_member_ids()
 
         # Remove the buttons from the old list message
         list_message_old = await get_live_message_object(self.bot, server_id, LiveMessageType.LIST)
         if list_message_old is not None:
             await list_message_old.edit(view=None)
 
-            with db_session_scope() as db_session:
-                # Delete the old list message from the database
-                list_live_message_old = db_session.get(LiveMessage, list_message_old.id)    # type: LiveMessage
-                if list_live_message_old is not None:
-                    db_session.delete(list_live_message_old)
+            # Delete the old list message from the database
+            await run_in_db_session(delete_live_message, list_message_old.id)
 
         list_embed = (await generate_list_embeds(server_id, user_ids))[0]
         embeds = [list_embed]
-        filter_embed = generate_filter_embed(server_id)
+        filter_embed = await generate_filter_embed(server_id)
         if filter_embed is not None:
             embeds.append(filter_embed)
-        unvoted_embed = generate_unvoted_embed(server_id)
+        unvoted_embed = await generate_unvoted_embed(server_id)
         if unvoted_embed is not None:
             embeds.append(unvoted_embed)
 
         list_message = await interaction.followup.send(embeds=embeds, wait=True)    # type: discord.Message
-        list_view = ListView(self.bot, list_embed.title, list_message.id, update_list, server_id)
+        list_view = ListView(self.bot, list_embed.title, list_message.id, update_list, server_id, snapshot.members)
         await list_message.edit(embeds=embeds, view=list_view)
 
-        with db_session_scope() as db_session:
-            list_live_message = LiveMessage(
-                server_id=server_id,
-                channel_id=list_message.channel.id,
-                message_id=list_message.id,
-                message_type=LiveMessageType.LIST,
-                selected_user_ids=user_ids
-            )
-            db_session.add(list_live_message)
+        list_live_message = LiveMessage(
+            server_id=server_id,
+            channel_id=list_message.channel.id,
+            message_id=list_message.id,
+            message_type=LiveMessageType.LIST,
+            selected_user_ids=user_ids
+        )
+        await run_in_db_session(lambda db_session: db_session.add(list_live_message))
 
     @app_commands.guild_only()
     @app_commands.command(name="owned_games", description="Displays a list of games that everyone has marked as owned.")
     async def display_owned_games(self, interaction: Interaction):
         server_id = interaction.guild.id
 
-        owned_games_embed = generate_owned_games_embed(server_id)
+        owned_games_embed = await generate_owned_games_embed(server_id)
 
         await interaction.response.send_message(embed=owned_games_embed)
 
@@ -351,8 +409,7 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
-            game = get_game(db_session, server_id, game_name)
+        game = await run_in_db_session(get_game, server_id, game_name)
 
         edit_game = EditGame(self.bot, game.server_id, game.id, interaction)
         await edit_game.send_message()
@@ -380,10 +437,13 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
+        def add(db_session: Session) -> Game:
             game = get_game(db_session, server_id, game_name)
 
             game.notes.append(note_text)
+            return game
+
+        game = await run_in_db_session(add)
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Added note \"{note_text}\" to game \"{game.name}\".")
@@ -401,14 +461,19 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
+        def remove(db_session: Session) -> tuple[Game, bool]:
             game = get_game(db_session, server_id, game_name)
 
             if note_text not in game.notes:
-                await interaction.followup.send(f"Game \"{game.name}\" does not have note \"{note_text}\".")
-                return
+                return game, False
 
             game.notes.remove(note_text)
+            return game, True
+
+        game, removed = await run_in_db_session(remove)
+        if not removed:
+            await interaction.followup.send(f"Game \"{game.name}\" does not have note \"{note_text}\".")
+            return
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Removed note \"{note_text}\" from game \"{game.name}\".")
@@ -433,13 +498,23 @@ class Backlog(commands.Cog):
             await interaction.followup.send("Steam ID must be a positive number.")
             return
 
-        with db_session_scope() as db_session:
+        # Retrieve the price before saving, so no database session is held open during the request
+        try:
+            steam_game_info = await get_steam_game_price(steam_id)
+        except ApiException as e:
+            log(f"Failed to link to Steam game ID {steam_id}: {e}")
+            await interaction.followup.send("Could not reach Steam, try again later.")
+            return
+
+        def link(db_session: Session) -> Game:
             game = get_game(db_session, server_id, game_name)
 
-            # Update the "steam_id" field, retrieve the price again, and save the new game data
+            # Update the "steam_id" field and save the new game data
             game.steam_id = steam_id
-            steam_game_info = await get_steam_game_price(steam_id)
             update_game_steam_prices_fields(game, steam_game_info)
+            return game
+
+        game = await run_in_db_session(link)
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Linked game \"{game.name}\" to Steam.")
@@ -453,11 +528,13 @@ class Backlog(commands.Cog):
         server_id = interaction.guild.id
         user_id = interaction.user.id
 
-        with db_session_scope() as db_session:
+        def save_alias(db_session: Session):
             server_member = db_session.get(ServerMember, (user_id, server_id))  # type: ServerMember
 
             server_member.alias = new_alias
 
+        await run_in_db_session(save_alias)
+
         await update_live_messages(self.bot, server_id)
         if new_alias is None:
             await interaction.followup.send("Cleared your alias.")
@@ -480,13 +557,14 @@ class Backlog(commands.Cog):
 
         server_id = interaction.guild.id
 
-        with db_session_scope() as db_session:
+        def rename(db_session: Session) -> str:
             game = get_game(db_session, server_id, game_name)
 
             old_game_name = game.name
             game.name = new_game_name
+            return old_game_name
 
-            clear_game_cache(server_id)
+        old_game_name = await run_in_db_session(rename)
 
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Renamed game \"{old_game_name}\" to \"{new_game_name}\".")
@@ -505,9 +583,10 @@ class Backlog(commands.Cog):
         except ValueError:
             steam_user_id = await get_steam_user_id(steam_profile_id)
 
-        owned_games = await get_owned_steam_games(steam_user_id)
+        # The user may have just made their profile public, so do not reuse an earlier fetch
+        owned_games = await get_owned_steam_games(steam_user_id, max_age=0)
 
-        with db_session_scope() as db_session:
+        def link(db_session: Session):
             server_member = db_session.get(ServerMember, (user_id, server_id))  # type: ServerMember
 
             # Save the Steam ID for this user in the database
@@ -515,5 +594,7 @@ class Backlog(commands.Cog):
 
             update_database_games_with_steam_user_data(db_session, server_id, user_id, owned_games)
 
+        await run_in_db_session(link)
+
         await update_live_messages(self.bot, server_id)
         await interaction.followup.send(f"Linked steam account \"{steam_profile_id}\".")
@@ -5,6 +5,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from apis.resilience import get_api_metrics_summary
 from services import bedtime
 from services.free_games import set_user_free_game_notifications
 from shared.error_reporter import send_error_message
@@ -76,6 +77,11 @@ class Tools(commands.Cog):
         except Exception as e:
             await send_error_message(self.bot, f"Error: failed to sync. {e}")
 
+    @commands.is_owner()
+    @commands.hybrid_command(name="api_status", description="Please don't use.")
+    async def api_status(self, ctx):
+        await ctx.send(f"```{get_api_metrics_summary()}```", ephemeral=True)
+
     @app_commands.command(name="help", description="Shows all commands.")
     async def help(self, interaction: discord.Interaction):
         # 20% chance to send a spooky message
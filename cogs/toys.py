@@ -7,7 +7,7 @@ from discord.ext import commands
 from discord import app_commands, Interaction
 from dotenv import load_dotenv
 
-from embeds.affinity import generate_affinity_embed
+from embeds.affinity import generate_affinity_embed, generate_server_affinity_embed
 from libraries.critters.critters import start_critters_game
 from services import dice_roller
 from services.eight_ball import use_eight_ball
@@ -102,6 +102,15 @@ class Toys(commands.Cog):
         server_id = interaction.guild.id
         user_id = interaction.user.id
 
-        affinity_embed = generate_affinity_embed(server_id, user_id)
+        affinity_embed = await generate_affinity_embed(server_id, user_id)
+
+        await interaction.response.send_message(embed=affinity_embed)
+
+    @app_commands.guild_only()
+    @app_commands.command(name="server_affinity", description="Shows which people vote most similarly to each other.")
+    async def show_server_affinity(self, interaction: Interaction):
+        server_id = interaction.guild.id
+
+        affinity_embed = await generate_server_affinity_embed(server_id)
 
         await interaction.response.send_message(embed=affinity_embed)
@@ -1,31 +1,105 @@
 import datetime
+import gzip
+import hashlib
 import os
-import shutil
+import sqlite3
+from typing import Optional
 
-from database.db import DATABASE_FILE
+from database.db import DATABASE_FILE, run_in_db_thread
 from shared.logger import log
 
 BACKUP_DIRECTORY = "backups"
+BACKUP_EXTENSION = ".bak.gz"
+# Uncompressed backups made before backups were compressed, which still count towards the maximum
+LEGACY_BACKUP_EXTENSION = ".bak"
 MAX_BACKUPS = 20
+# Amount of database pages copied per backup step, so writers only have to wait for a single step at a time
+BACKUP_PAGES_PER_STEP = 1024
+HASH_LENGTH = 16
 
 
-def create_backup(file_to_backup=DATABASE_FILE):
+async def create_backup(file_to_backup=DATABASE_FILE) -> None:
+    """
+    Creates a compressed backup of the database on a database thread, without blocking the event loop.
+    """
+    await run_in_db_thread(create_backup_blocking, file_to_backup)
+
+
+def create_backup_blocking(file_to_backup=DATABASE_FILE) -> Optional[str]:
+    """
+    Creates a compressed backup of the database, using SQLite's online backup API so it is consistent even while the
+    database is being written to. A backup identical to the latest one is not saved again.
+    Returns the path of the new backup, or None if nothing changed.
+    Backups are gzipped SQLite databases, so restore them by decompressing them in place of the database file.
+    """
     # Ensure the backup directory exists
     os.makedirs(BACKUP_DIRECTORY, exist_ok=True)
 
-    # Create a new backup with a timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = os.path.basename(file_to_backup)
-    backup_filepath = os.path.join(BACKUP_DIRECTORY, f"{filename}_{timestamp}.bak")
-    shutil.copy2(file_to_backup, backup_filepath)
-    log(f"Created backup: {backup_filepath}")
+    snapshot_filepath = os.path.join(BACKUP_DIRECTORY, f"{filename}.snapshot")
+    partial_filepath = os.path.join(BACKUP_DIRECTORY, f"{filename}.partial")
+
+    try:
+        _copy_database(file_to_backup, snapshot_filepath)
+        backup_hash = _compress_file(snapshot_filepath, partial_filepath)
+    finally:
+        if os.path.exists(snapshot_filepath):
+            os.remove(snapshot_filepath)
 
-    # Get all the backups for the requested file, and sort them from old to new
-    relevant_backups = [os.path.join(BACKUP_DIRECTORY, f) for f in os.listdir(BACKUP_DIRECTORY) if f.startswith(filename) and f.endswith(".bak")]
-    backups = sorted(relevant_backups, key=os.path.getctime)
+    # Get all the backups for the requested file, sorted from old to new by the timestamp in their name
+    backups = _get_backups(filename)
+    compressed_backups = [backup for backup in backups if backup.endswith(BACKUP_EXTENSION)]
+    if len(compressed_backups) > 0 and _get_backup_hash(compressed_backups[-1]) == backup_hash:
+        os.remove(partial_filepath)
+        log(f"Skipped backup, the database has not changed since: {compressed_backups[-1]}")
+        return None
+
+    # Create a new backup with a timestamp and its hash
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_filepath = os.path.join(BACKUP_DIRECTORY, f"{filename}_{timestamp}_{backup_hash}{BACKUP_EXTENSION}")
+    os.replace(partial_filepath, backup_filepath)
+    log(f"Created backup: {backup_filepath}")
+    backups.append(backup_filepath)
 
     # Remove the oldest backups if we have too many
     while len(backups) > MAX_BACKUPS:
         oldest_backup = backups.pop(0)
         os.remove(oldest_backup)
         log(f"Deleted old backup: {oldest_backup}")
+
+    return backup_filepath
+
+
+def _copy_database(source_filepath: str, destination_filepath: str) -> None:
+    source = sqlite3.connect(source_filepath)
+    destination = sqlite3.connect(destination_filepath)
+    try:
+        source.backup(destination, pages=BACKUP_PAGES_PER_STEP)
+    finally:
+        destination.close()
+        source.close()
+
+
+def _compress_file(source_filepath: str, destination_filepath: str) -> str:
+    """
+    Gzips the given file, and returns the hash of its uncompressed contents.
+    """
+    file_hash = hashlib.sha256()
+    with open(source_filepath, "rb") as source, gzip.open(destination_filepath, "wb") as destination:
+        while chunk := source.read(1024 * 1024):
+            file_hash.update(chunk)
+            destination.write(chunk)
+
+    return file_hash.hexdigest()[:HASH_LENGTH]
+
+
+def _get_backups(filename: str) -> list[str]:
+    backups = [
+        f for f in os.listdir(BACKUP_DIRECTORY)
+        if f.startswith(f"{filename}_") and (f.endswith(BACKUP_EXTENSION) or f.endswith(LEGACY_BACKUP_EXTENSION))
+    ]
+    return [os.path.join(BACKUP_DIRECTORY, f) for f in sorted(backups)]
+
+
+def _get_backup_hash(backup_filepath: str) -> str:
+    return os.path.basename(backup_filepath)[:-len(BACKUP_EXTENSION)].rsplit("_", 1)[-1]
@@ -1,16 +1,55 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from typing import Optional, Callable, TypeVar
 
 from alembic import command
 from alembic.config import Config
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_FILE = "database/bot_data.db"
 
-engine = create_engine("sqlite:///" + DATABASE_FILE, echo=False)
+# SQLite settings applied to every new connection
+DATABASE_PRAGMAS = {
+    "journal_mode": "WAL",          # Readers don't block the writer, and commits only append to the log
+    "synchronous": "NORMAL",        # Safe in WAL mode, only the last commits can be lost on a power failure
+    "mmap_size": 64 * 1024 * 1024,  # 64 MiB
+    "cache_size": -16 * 1024,       # Negative values are in KiB, so 16 MiB
+    "busy_timeout": 5000,           # Milliseconds to wait on a locked database before failing
+}
+
+
+def create_database_engine(database_file: str, pragmas: Optional[dict] = None) -> Engine:
+    """
+    Creates an engine for the given SQLite file, which applies the given pragmas (DATABASE_PRAGMAS by default) on connect.
+    """
+    if pragmas is None:
+        pragmas = DATABASE_PRAGMAS
+
+    new_engine = create_engine("sqlite:///" + database_file, echo=False)
+
+    @event.listens_for(new_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return new_engine
+
+
+engine = create_database_engine(DATABASE_FILE)
 SessionMaker = sessionmaker(bind=engine, expire_on_commit=False)
 BaseModel = declarative_base()
 
+# Database work is run on these threads, so it never blocks the event loop
+DATABASE_THREAD_COUNT = 4
+_database_executor = ThreadPoolExecutor(max_workers=DATABASE_THREAD_COUNT, thread_name_prefix="database")
+
+T = TypeVar("T")
+
 
 @contextmanager
 def db_session_scope():
@@ -25,6 +64,26 @@ def db_session_scope():
         session.close()
 
 
+async def run_in_db_thread(function: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Runs the given blocking function on a database thread, and waits for its result without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_database_executor, functools.partial(function, *args, **kwargs))
+
+
+async def run_in_db_session(function: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Runs the given function on a database thread, passing a new database session as its first argument.
+    The session is committed afterwards, or rolled back if the function raised an exception.
+    """
+    def run_in_session():
+        with db_session_scope() as db_session:
+            return function(db_session, *args, **kwargs)
+
+    return await run_in_db_thread(run_in_session)
+
+
 def update_db():
     # Run migrations
     # Migration can be created by running (in /database):
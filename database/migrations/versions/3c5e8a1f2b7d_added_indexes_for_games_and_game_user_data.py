@@ -0,0 +1,38 @@
+"""added indexes for games and game user data
+
+Revision ID: 3c5e8a1f2b7d
+Revises: f319ad2cfeb0
+Create Date: 2026-10-17 14:02:51.218406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e8a1f2b7d'
+down_revision: Union[str, Sequence[str], None] = 'f319ad2cfeb0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('games', schema=None) as batch_op:
+        batch_op.create_index('ix_games_server_id_finished', ['server_id', 'finished'], unique=False)
+        batch_op.create_index('ix_games_server_id_lower_name', ['server_id', sa.text('lower(name)')], unique=False)
+
+    with op.batch_alter_table('game_user_data', schema=None) as batch_op:
+        batch_op.create_index('ix_game_user_data_server_id_user_id', ['server_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('game_user_data', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_user_data_server_id_user_id')
+
+    with op.batch_alter_table('games', schema=None) as batch_op:
+        batch_op.drop_index('ix_games_server_id_lower_name')
+        batch_op.drop_index('ix_games_server_id_finished')
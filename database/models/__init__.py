@@ -3,7 +3,10 @@ from .free_game import *
 from .free_game_subscriber import *
 from .game import *
 from .game_user_data import *
+from .igdb_game import *
 from .live_message import *
 from .server import *
 from .server_member import *
+from .steam_app import *
+from .steam_catalog_app import *
 from .user import *
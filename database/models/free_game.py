@@ -31,11 +31,15 @@ class FreeGame(BaseModel):
         # Calculate how much time is left for this deal and add it to a presentable string
         expiry_string = ""
         if self.expiry_datetime:
+            expiry_datetime = self.expiry_datetime
+            if expiry_datetime.tzinfo is None:
+                # SQLite does not store the time zone, and the expiry is saved in UTC
+                expiry_datetime = expiry_datetime.replace(tzinfo=datetime.timezone.utc)
             expiry_string = " until "
-            timestamp = int(self.expiry_datetime.timestamp())
+            timestamp = int(expiry_datetime.timestamp())
             formatted_time = f"<t:{timestamp}:f>"
             expiry_string += formatted_time
-            time_until_expiry = self.expiry_datetime - datetime.datetime.now(self.expiry_datetime.tzinfo)
+            time_until_expiry = expiry_datetime - datetime.datetime.now(datetime.timezone.utc)
             days_until_expiry = time_until_expiry.days
             expiry_string += " ("
             if days_until_expiry > 0:
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, Boolean, JSON, Float, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, JSON, Float, Enum, ForeignKey, Index, func
 from sqlalchemy.ext.mutable import MutableList
 
 from database.db import BaseModel
@@ -31,3 +31,9 @@ class Game(BaseModel):
 
     finished = Column(Boolean, default=False)
     finished_timestamp = Column(Float)
+
+    __table_args__ = (
+        Index("ix_games_server_id_finished", "server_id", "finished"),
+        # Used to look up games by name case-insensitively
+        Index("ix_games_server_id_lower_name", "server_id", func.lower(name)),
+    )
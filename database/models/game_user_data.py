@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float, Boolean
+from sqlalchemy import Column, Integer, ForeignKey, Float, Boolean, Index
 
 from database.db import BaseModel
 
@@ -15,3 +15,8 @@ class GameUserData(BaseModel):
     played_before = Column(Boolean)
 
     enjoyment_score = Column(Float)
+
+    # Lookups by server and game are covered by the primary key
+    __table_args__ = (
+        Index("ix_game_user_data_server_id_user_id", "server_id", "user_id"),
+    )
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, JSON, Float
+
+from database.db import BaseModel
+
+
+class IgdbGame(BaseModel):
+    """
+    Cached IGDB search result for a game name. A missing IGDB ID means that IGDB did not find the game.
+    """
+    __tablename__ = "igdb_games"
+
+    search_name = Column(String, primary_key=True)     # Normalized name that was searched for
+    igdb_id = Column(Integer, index=True)
+    name = Column(String)
+    multiplayer_modes = Column(JSON)
+    updated_at = Column(Float, nullable=False)
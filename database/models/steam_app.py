@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, Boolean, JSON, Float
+
+from database.db import BaseModel
+
+
+class SteamApp(BaseModel):
+    """
+    Cached data of a Steam store app. The details and the price are cached separately, as prices change more often.
+    """
+    __tablename__ = "steam_apps"
+
+    id = Column(Integer, primary_key=True)
+
+    name = Column(String)
+    header_image = Column(String)
+    genres = Column(JSON)
+    coming_soon = Column(Boolean)
+    is_free = Column(Boolean)
+    details_updated_at = Column(Float)
+
+    price_overview = Column(JSON)
+    price_updated_at = Column(Float)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String
+
+from database.db import BaseModel
+
+
+class SteamCatalogApp(BaseModel):
+    """
+    A game from Steam's list of all apps, used to look up Steam IDs by name without searching the store.
+    """
+    __tablename__ = "steam_catalog_apps"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    last_modified = Column(Integer, nullable=False)     # Unix timestamp of the last change to the app on Steam
@@ -0,0 +1,234 @@
+import threading
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from database.db import SessionMaker, db_session_scope, run_in_db_thread
+from database.models import Game, GameUserData, ServerMember, LiveMessage, LiveMessageType, User
+from shared.affinity_matrix import AffinityMatrix
+from shared.vote_matrix import VoteMatrix
+
+GAMES = "games"
+MEMBERS = "members"
+GAME_USER_DATA = "game_user_data"
+LIVE_MESSAGES = "live_messages"
+SNAPSHOT_PARTS = [GAMES, MEMBERS, GAME_USER_DATA, LIVE_MESSAGES]
+
+# Which part of a server's snapshot each model is cached in
+MODEL_SNAPSHOT_PARTS = {
+    Game: GAMES,
+    ServerMember: MEMBERS,
+    User: MEMBERS,      # Users are shared between servers, so a change invalidates the members of every server
+    GameUserData: GAME_USER_DATA,
+    LiveMessage: LIVE_MESSAGES,
+}
+
+# Version counters for each (server ID, snapshot part). A server ID of None holds the counters for changes affecting all servers
+_versions: dict[tuple[Optional[int], str], int] = {}
+_versions_lock = threading.Lock()
+# Caches the snapshot for each server ID
+_snapshots: dict[int, "ServerSnapshot"] = {}
+
+_CHANGED_PARTS_KEY = "changed_snapshot_parts"
+
+
+def get_version(server_id: int, part: str) -> tuple[int, int]:
+    return _versions.get((server_id, part), 0), _versions.get((None, part), 0)
+
+
+def invalidate_server_cache(server_id: Optional[int], part: str) -> None:
+    """
+    Bumps the version of the given part of a server's snapshot, so it gets reloaded on its next use.
+    A server ID of None invalidates the part for all servers.
+    """
+    # Commits run on several database threads, so an unguarded increment could be lost
+    with _versions_lock:
+        _versions[(server_id, part)] = _versions.get((server_id, part), 0) + 1
+
+
+class ServerSnapshot:
+    """
+    Holds a server's games, members, game user data, and live messages in memory.
+    Each part is only reloaded from the database once its version has changed.
+    """
+
+    def __init__(self, server_id: int) -> None:
+        super().__init__()
+        self.server_id = server_id
+        self.games = []             # type: list[Game]
+        self.members = []           # type: list[ServerMember]
+        self.game_user_data = []    # type: list[GameUserData]
+        self.live_messages = []     # type: list[LiveMessage]
+        self.versions = {}          # type: dict[str, tuple[int, int]]
+        self._vote_matrix = None    # type: Optional[VoteMatrix]
+        self._affinity_matrix = None    # type: Optional[AffinityMatrix]
+        self._display_names = None      # type: Optional[dict[int, str]]
+        self._refresh_lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return any(self.versions.get(part) != get_version(self.server_id, part) for part in SNAPSHOT_PARTS)
+
+    def refresh(self) -> None:
+        # Only let one thread reload at a time, the others can then use the reloaded data
+        with self._refresh_lock:
+            stale_parts = {}
+            for part in SNAPSHOT_PARTS:
+                # Read the version before loading, so a write that happens during loading makes the snapshot stale again
+                version = get_version(self.server_id, part)
+                if self.versions.get(part) != version:
+                    stale_parts[part] = version
+
+            if len(stale_parts) == 0:
+                return
+
+            with db_session_scope() as db_session:
+                loaded_parts = {part: self._load_part(db_session, part) for part in stale_parts}
+            games = loaded_parts.get(GAMES, self.games)
+            members = loaded_parts.get(MEMBERS, self.members)
+            game_user_data = loaded_parts.get(GAME_USER_DATA, self.game_user_data)
+            live_messages = loaded_parts.get(LIVE_MESSAGES, self.live_messages)
+
+            # Build the derived data here instead of lazily on the event loop, so it can never be built from data that
+            # is being replaced and then be kept after the replacement
+            display_names = self._display_names
+            if MEMBERS in stale_parts:
+                display_names = _get_display_names(members)
+            vote_matrix = self._vote_matrix
+            affinity_matrix = self._affinity_matrix
+            if MEMBERS in stale_parts or GAME_USER_DATA in stale_parts:
+                vote_matrix = VoteMatrix([member.user_id for member in members], game_user_data)
+                affinity_matrix = AffinityMatrix(vote_matrix)
+
+            self.games = games
+            self.members = members
+            self.game_user_data = game_user_data
+            self.live_messages = live_messages
+            self._display_names = display_names
+            self._vote_matrix = vote_matrix
+            self._affinity_matrix = affinity_matrix
+            self.versions.update(stale_parts)
+
+    def _load_part(self, db_session: Session, part: str) -> list:
+        if part == GAMES:
+            return (
+                db_session.query(Game)
+                    .filter(Game.server_id == self.server_id)
+                    .order_by(Game.id)
+                    .all()
+            )
+        elif part == MEMBERS:
+            return (
+                db_session.query(ServerMember)
+                    .options(joinedload(ServerMember.user))     # Also preemptively retrieve User data
+                    .filter(ServerMember.server_id == self.server_id)
+                    .order_by(ServerMember.user_id)
+                    .all()
+            )
+        elif part == GAME_USER_DATA:
+            return (
+                db_session.query(GameUserData)
+                    .filter(GameUserData.server_id == self.server_id)
+                    .all()
+            )
+        elif part == LIVE_MESSAGES:
+            return (
+                db_session.query(LiveMessage)
+                    .filter(LiveMessage.server_id == self.server_id)
+                    .all()
+            )
+        raise ValueError(f"Unknown snapshot part: {part}")
+
+    def get_games(self, finished: Optional[bool] = None) -> list[Game]:
+        if finished is None:
+            return list(self.games)
+        return [game for game in self.games if game.finished is finished]
+
+    def get_game(self, game_id: int, finished: Optional[bool] = None) -> Optional[Game]:
+        return next((game for game in self.get_games(finished) if game.id == game_id), None)
+
+    def get_member_ids(self) -> list[int]:
+        return [member.user_id for member in self.members]
+
+    def get_display_names(self) -> dict[int, str]:
+        """
+        Returns each member's alias, falling back to their global name if not set.
+        Members with an alias come first, in order of user ID.
+        """
+        return self._display_names if self._display_names is not None else {}
+
+    def get_display_name(self, user_id: int) -> Optional[str]:
+        return self.get_display_names().get(user_id)
+
+    def get_live_message(self, message_type: LiveMessageType) -> Optional[LiveMessage]:
+        return next((live_message for live_message in self.live_messages if live_message.message_type == message_type), None)
+
+    @property
+    def vote_matrix(self) -> VoteMatrix:
+        if self._vote_matrix is None:
+            return VoteMatrix(self.get_member_ids(), self.game_user_data)
+        return self._vote_matrix
+
+    @property
+    def affinity_matrix(self) -> AffinityMatrix:
+        if self._affinity_matrix is None:
+            return AffinityMatrix(self.vote_matrix)
+        return self._affinity_matrix
+
+
+def _get_display_names(members: list[ServerMember]) -> dict[int, str]:
+    members = sorted(members, key=lambda member: member.alias is None)
+    return {member.user_id: member.alias if member.alias is not None else member.user.global_name for member in members}
+
+
+def _get_cached_snapshot(server_id: int) -> ServerSnapshot:
+    snapshot = _snapshots.get(server_id)
+    if snapshot is None:
+        snapshot = _snapshots.setdefault(server_id, ServerSnapshot(server_id))
+    return snapshot
+
+
+async def load_server_snapshot(server_id: int) -> ServerSnapshot:
+    """
+    Returns the cached snapshot of the given server, reloading the parts that have changed on a database thread.
+    """
+    snapshot = _get_cached_snapshot(server_id)
+    if snapshot.is_stale():
+        await run_in_db_thread(snapshot.refresh)
+    return snapshot
+
+
+@event.listens_for(SessionMaker, "after_flush")
+def _collect_changed_parts(session: Session, flush_context) -> None:
+    changed_parts = session.info.setdefault(_CHANGED_PARTS_KEY, set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        part = MODEL_SNAPSHOT_PARTS.get(type(instance))
+        if part is None:
+            continue
+        server_id = getattr(instance, "server_id", None)
+        changed_parts.add((server_id, part))
+
+
+@event.listens_for(SessionMaker, "do_orm_execute")
+def _collect_bulk_changed_parts(orm_execute_state) -> None:
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    # Bulk statements don't tell which servers they affect, so invalidate the part for all servers
+    changed_parts = orm_execute_state.session.info.setdefault(_CHANGED_PARTS_KEY, set())
+    for mapper in orm_execute_state.all_mappers:
+        part = MODEL_SNAPSHOT_PARTS.get(mapper.class_)
+        if part is not None:
+            changed_parts.add((None, part))
+
+
+@event.listens_for(SessionMaker, "after_commit")
+def _invalidate_changed_parts(session: Session) -> None:
+    # Only invalidate once the changes are committed, so no snapshot gets reloaded with uncommitted data
+    for server_id, part in session.info.pop(_CHANGED_PARTS_KEY, set()):
+        invalidate_server_cache(server_id, part)
+
+
+@event.listens_for(SessionMaker, "after_rollback")
+def _discard_changed_parts(session: Session) -> None:
+    session.info.pop(_CHANGED_PARTS_KEY, None)
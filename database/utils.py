@@ -1,21 +1,10 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from database.db import db_session_scope
-from database.models import ServerMember, Game, User
+from database.models import Game, GameUserData, User
 from shared.exceptions import GameNotFoundException, UserNotFoundException
 
 
-def get_server_members(server_id: int) -> list[ServerMember]:
-    with db_session_scope() as db_session:
-        members = (
-            db_session.query(ServerMember)
-                .filter(ServerMember.server_id == server_id)
-                .all()
-        )  # type: list[ServerMember]
-
-    return members
-
-
 def get_game(db_session: Session, server_id: int, game_name: str, finished=False) -> Game:
     """
     Returns the game's data from the database as a Game object.
@@ -46,7 +35,7 @@ def get_game(db_session: Session, server_id: int, game_name: str, finished=False
         game = (
             db_session.query(Game)
                 .filter(Game.server_id == server_id)
-                .filter(Game.name.ilike(game_name))
+                .filter(func.lower(Game.name) == func.lower(game_name))
                 .filter(Game.finished.is_(finished))
                 .first()
         )   # type: Game
@@ -58,3 +47,27 @@ def get_game(db_session: Session, server_id: int, game_name: str, finished=False
                 raise GameNotFoundException(f"Could not find game with name \"{game_name}\". Use: !add \"game name\", to add a new game.")
 
         return game
+
+
+def get_unvoted_games(db_session: Session, server_id: int, user_id: int) -> list[Game]:
+    """
+    Returns the unfinished games that the user has not voted on yet, ordered by ID.
+    """
+    voted = (
+        db_session.query(GameUserData)
+            .filter(GameUserData.server_id == Game.server_id)
+            .filter(GameUserData.game_id == Game.id)
+            .filter(GameUserData.user_id == user_id)
+            .filter(GameUserData.vote.isnot(None))
+            .exists()
+    )
+    games = (
+        db_session.query(Game)
+            .filter(Game.server_id == server_id)
+            .filter(Game.finished.is_(False))
+            .filter(~voted)
+            .order_by(Game.id)
+            .all()
+    )  # type: list[Game]
+
+    return games
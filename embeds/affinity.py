@@ -1,68 +1,64 @@
-from collections import defaultdict
-
 import discord
 
-from database.db import db_session_scope
-from database.models import GameUserData, User
+from database.db import run_in_db_session
+from database.models import User
+from database.server_cache import load_server_snapshot
+from embeds.utils import get_users_aliases_string
 
 AFFINITY_EMBED_COLOR = discord.Color.purple()
+TOP_PAIRS_COUNT = 10
 
 
-def generate_affinity_embed(server_id: int, user_id: int) -> discord.Embed:
-    with db_session_scope() as db_session:
-        game_user_data_votes = (
-            db_session.query(GameUserData)
-                .filter(GameUserData.server_id == server_id)
-                .filter(GameUserData.vote.isnot(None))
-                .all()
-        )   # type: list[GameUserData]
+async def generate_affinity_embed(server_id: int, user_id: int) -> discord.Embed:
+    snapshot = await load_server_snapshot(server_id)
 
-        vote_data_by_game = defaultdict(list)   # type: dict[int, list[GameUserData]]
-        for data in game_user_data_votes:
-            vote_data_by_game[data.game_id].append(data)
+    # Sorted so the highest affinity shows up first
+    similarity_percentages = snapshot.affinity_matrix.get_user_affinities(user_id)
 
-        similarity_scores = defaultdict(lambda: defaultdict(int))   # type: dict[int, dict[str, int]]
-        for game_id, game_vote_data in vote_data_by_game.items():
-            # Skip this game if the user hasn't voted on it
-            user_data = next((data for data in game_vote_data if data.user_id == user_id), None)
-            if user_data is None:
-                continue
+    if len(similarity_percentages) == 0:
+        affinity_text = "No people have voted on the same games."
+    else:
+        entries = []
+        for other_user_id, affinity in similarity_percentages:
+            alias = snapshot.get_display_name(other_user_id)
+            entries.append(f"{alias}: {affinity}%")
+        affinity_text = "\n".join(entries)
 
-            # Check the votes for this game
-            for data in game_vote_data:
-                if data.user_id == user_id:
-                    continue
+    user_db_entry = await run_in_db_session(lambda db_session: db_session.get(User, user_id))   # type: User
 
-                similarity_scores[data.user_id]["error_sum"] += abs(user_data.vote - data.vote)
-                similarity_scores[data.user_id]["votes"] += 1
+    # Get info on the game and display it in an embed
+    title = f"{user_db_entry.global_name}'s affinity with others"
+    affinity_embed = discord.Embed(
+        title=title,
+        description=affinity_text,
+        color=AFFINITY_EMBED_COLOR
+    )
+    return affinity_embed
 
-        similarity_percentages = []
-        for user, stats in similarity_scores.items():
-            if stats["count"] > 0:
-                # Calculate the Mean Absolute Error
-                mae = stats["error_sum"] / stats["count"]
-                # Convert it to a percentage
-                similarity = (1 - (mae / 10)) * 100
-                similarity_percentages.append((user, round(similarity, 2)))
 
-        # Sort it so the highest affinity shows up first
-        similarity_percentages = sorted(similarity_percentages, key=lambda x: x[1], reverse=True)
+async def generate_server_affinity_embed(server_id: int) -> discord.Embed:
+    snapshot = await load_server_snapshot(server_id)
+    affinity_matrix = snapshot.affinity_matrix
 
-        if len(similarity_percentages) == 0:
-            affinity_text = "No people have voted on the same games."
-        else:
-            entries = []
-            for user, affinity in similarity_percentages:
-                entries.append(f"{user}: {affinity}%")
-            affinity_text = "\n".join(entries)
+    top_pairs = affinity_matrix.get_top_pairs(TOP_PAIRS_COUNT)
+    if len(top_pairs) == 0:
+        affinity_text = "No people have voted on the same games."
+    else:
+        entries = []
+        for user_id, other_user_id, affinity in top_pairs:
+            alias = snapshot.get_display_name(user_id)
+            other_alias = snapshot.get_display_name(other_user_id)
+            entries.append(f"{alias} & {other_alias}: {affinity}%")
+        affinity_text = "**Top pairs**\n" + "\n".join(entries)
 
-        user_db_entry = db_session.get(User, user_id)   # type: User
+        clusters = affinity_matrix.get_clusters()
+        if len(clusters) > 0:
+            cluster_entries = [get_users_aliases_string(snapshot, cluster) for cluster in clusters]
+            affinity_text += "\n\n**Clusters**\n" + "\n".join(cluster_entries)
 
-        # Get info on the game and display it in an embed
-        title = f"{user_db_entry.global_name}'s affinity with others"
-        affinity_embed = discord.Embed(
-            title=title,
-            description=affinity_text,
-            color=AFFINITY_EMBED_COLOR
-        )
-        return affinity_embed
+    affinity_embed = discord.Embed(
+        title="Affinity between members",
+        description=affinity_text,
+        color=AFFINITY_EMBED_COLOR
+    )
+    return affinity_embed
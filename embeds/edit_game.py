@@ -4,8 +4,9 @@ from discord.ext.commands import Bot
 from discord.ui import View, Button, Select
 from sqlalchemy.orm import Session
 
-from database.db import db_session_scope
+from database.db import run_in_db_session
 from database.models import Game, GameUserData
+from database.server_cache import load_server_snapshot
 from embeds.utils import get_game_embed_field
 from shared.error_reporter import send_error_message
 from shared.live_messages import update_live_messages
@@ -23,13 +24,13 @@ class EditGame:
         self.message_object = None
 
     async def send_message(self):
-        game_embed = self.get_embed()
+        game_embed = await self.get_embed()
         game_view = self.EditGameView(self.bot, self)
 
         self.message_object = await self.interaction.followup.send(embed=game_embed, view=game_view)     # type: discord.WebhookMessage
 
     async def update_message(self):
-        game_embed = self.get_embed()
+        game_embed = await self.get_embed()
         game_view = self.EditGameView(self.bot, self)
         await self.message_object.edit(embed=game_embed, view=game_view)    # type: discord.Message
 
@@ -44,17 +45,17 @@ class EditGame:
                 .first()
         )  # type: Game
 
-    def get_embed(self):
-        with db_session_scope() as db_session:
-            game = self.get_game(db_session)
+    async def get_embed(self):
+        snapshot = await load_server_snapshot(self.server_id)
+        game = snapshot.get_game(self.game_id, finished=False)
 
-            # Get info on the game and display it in an embed
-            embed_field_info = get_game_embed_field(game)
-            title = embed_field_info["name"]
-            embed_field_info["name"] = ""
-            game_embed = discord.Embed(title=title, color=EDIT_GAME_EMBED_COLOR)
-            game_embed.add_field(**embed_field_info)
-            return game_embed
+        # Get info on the game and display it in an embed
+        embed_field_info = get_game_embed_field(snapshot, game)
+        title = embed_field_info["name"]
+        embed_field_info["name"] = ""
+        game_embed = discord.Embed(title=title, color=EDIT_GAME_EMBED_COLOR)
+        game_embed.add_field(**embed_field_info)
+        return game_embed
 
     async def delete_message(self):
         await self.message_object.delete()
@@ -75,11 +76,18 @@ class EditGame:
 
         async def interaction_check(self, interaction: discord.Interaction) -> bool:
             try:
-                with db_session_scope() as db_session:
-                    await interaction.response.defer()
+                await interaction.response.defer()
 
-                    user_id = interaction.user.id
-                    button_id = interaction.data.get("custom_id")
+                user_id = interaction.user.id
+                button_id = interaction.data.get("custom_id")
+
+                if button_id == "close":
+                    await self.edit_game_object.delete_message()
+                    return True
+                elif button_id not in ["owned", "played_before", "local"]:
+                    return True
+
+                def toggle_field(db_session: Session):
                     game = self.edit_game_object.get_game(db_session)
                     game_user_data = db_session.get(GameUserData, (game.server_id, game.id, user_id))  # type: GameUserData
                     if game_user_data is None:
@@ -94,11 +102,8 @@ class EditGame:
                         game_user_data.played_before = not played_before
                     elif button_id == "local":
                         game.local = not game.local
-                    elif button_id == "close":
-                        await self.edit_game_object.delete_message()
-                        return True
-                    else:
-                        return True
+
+                await run_in_db_session(toggle_field)
 
                 await self.edit_game_object.update_message()
 
@@ -118,9 +123,10 @@ class EditGame:
         async def callback(self, interaction: discord.Interaction):
 
             try:
-                with db_session_scope() as db_session:
-                    score = int(self.values[0])
-                    user_id = interaction.user.id
+                score = int(self.values[0])
+                user_id = interaction.user.id
+
+                def save_vote(db_session: Session):
                     game = self.edit_game_object.get_game(db_session)
 
                     game_user_data = db_session.get(GameUserData, (game.server_id, game.id, user_id))   # type: GameUserData
@@ -130,6 +136,8 @@ class EditGame:
 
                     game_user_data.vote = score
 
+                await run_in_db_session(save_vote)
+
                 await self.edit_game_object.update_message()
 
             except Exception as e:
@@ -145,11 +153,14 @@ class EditGame:
 
         async def callback(self, interaction: discord.Interaction):
             try:
-                with db_session_scope() as db_session:
-                    player_count = int(self.values[0])
+                player_count = int(self.values[0])
+
+                def save_player_count(db_session: Session):
                     game = self.edit_game_object.get_game(db_session)
                     game.player_count = player_count
 
+                await run_in_db_session(save_player_count)
+
                 await self.edit_game_object.update_message()
 
             except Exception as e:
@@ -2,9 +2,8 @@ from typing import Optional
 
 import discord
 
-from database.db import db_session_scope
-from database.models import Game, GameUserData, LiveMessageType, LiveMessage, ReleaseState
-from database.utils import get_server_members
+from database.models import LiveMessageType, ReleaseState
+from database.server_cache import load_server_snapshot
 from embeds.utils import get_users_aliases_string, generate_price_text, EMOJIS, \
     sort_games_by_score_and_selected_users, filter_games_by_selected_users, sort_games_by_score
 from shared.embed_pagination import paginate_embed_description
@@ -12,44 +11,28 @@ from shared.embed_pagination import paginate_embed_description
 LIST_EMBED_COLOR = discord.Color.blurple()
 
 
-def generate_unvoted_embed(server_id: int) -> Optional[discord.Embed]:
-    with db_session_scope() as db_session:
-        games = (
-            db_session.query(Game)
-                .filter(Game.server_id == server_id)
-                .filter(Game.finished.is_(False))
-                .all()
-        )  # type: list[Game]
-
-        members = get_server_members(server_id)
-        member_ids = [member.user_id for member in members]
-
-        unvoted_games_map = {}  # type: dict[int, list[Game]]
-        for game in games:
-            game_user_data_votes = (
-                db_session.query(GameUserData)
-                    .filter(GameUserData.server_id == server_id)
-                    .filter(GameUserData.game_id == game.id)
-                    .filter(GameUserData.vote.isnot(None))
-                    .all()
-            )  # type: list[GameUserData]
-
-            voter_ids = [game_user_data.user_id for game_user_data in game_user_data_votes]
-            non_voters = list(set(member_ids) - set(voter_ids))
-            non_voters.sort()
-
-            for non_voter in non_voters:
-                if non_voter not in unvoted_games_map:
-                    unvoted_games_map[non_voter] = []
-                unvoted_games_map[non_voter].append(game)
-
-    if len(unvoted_games_map) == 0:
+async def generate_unvoted_embed(server_id: int) -> Optional[discord.Embed]:
+    snapshot = await load_server_snapshot(server_id)
+    games = snapshot.get_games(finished=False)
+    vote_matrix = snapshot.vote_matrix
+
+    member_columns = [(user_id, vote_matrix.columns[user_id]) for user_id in vote_matrix.member_ids]
+
+    # Users are ordered by the first game they haven't voted on
+    unvoted_count_map = {}  # type: dict[int, int]
+    for game in games:
+        votes = vote_matrix.get_votes(game.id)
+        for user_id, column in member_columns:
+            if votes[column] is None:
+                unvoted_count_map[user_id] = unvoted_count_map.get(user_id, 0) + 1
+
+    if len(unvoted_count_map) == 0:
         return None
 
     unvoted_counts = []
-    for user_id, unvoted_games in unvoted_games_map.items():
-        alias = get_users_aliases_string(server_id, [user_id])
-        unvoted_counts.append(f"{alias}: {len(unvoted_games)}")
+    for user_id, unvoted_count in unvoted_count_map.items():
+        alias = snapshot.get_display_name(user_id)
+        unvoted_counts.append(f"{alias}: {unvoted_count}")
 
     description = ", ".join(unvoted_counts)
     return discord.Embed(
@@ -59,25 +42,19 @@ def generate_unvoted_embed(server_id: int) -> Optional[discord.Embed]:
     )
 
 
-def generate_filter_embed(server_id: int) -> Optional[discord.Embed]:
+async def generate_filter_embed(server_id: int) -> Optional[discord.Embed]:
     description = ""
 
-    with db_session_scope() as db_session:
-        list_message = (
-            db_session.query(LiveMessage)
-                .filter(LiveMessage.server_id == server_id)
-                .filter(LiveMessage.message_type == LiveMessageType.LIST)
-                .first()
-        )   # type: LiveMessage
+    snapshot = await load_server_snapshot(server_id)
+    list_message = snapshot.get_live_message(LiveMessageType.LIST)
 
     if list_message is not None:
         selected_user_ids = list_message.selected_user_ids
     else:
-        members = get_server_members(server_id)
-        selected_user_ids = [member.user_id for member in members]
+        selected_user_ids = snapshot.get_member_ids()
 
     if len(selected_user_ids) > 0:
-        aliases = get_users_aliases_string(server_id, selected_user_ids)
+        aliases = get_users_aliases_string(snapshot, selected_user_ids)
         description += f"\nSelected users: {aliases}"
 
     description = description.strip()
@@ -92,74 +69,63 @@ def generate_filter_embed(server_id: int) -> Optional[discord.Embed]:
 
 
 async def generate_list_embeds(server_id: int, selected_user_ids: list[int]) -> list[discord.Embed]:
-    with db_session_scope() as db_session:
-        games = (
-            db_session.query(Game)
-                .filter(Game.server_id == server_id)
-                .filter(Game.finished.is_(False))
-                .all()
-        )   # type: list[Game]
+    snapshot = await load_server_snapshot(server_id)
+    games = snapshot.get_games(finished=False)
+    # The votes are kept in memory, so the games can be filtered and sorted without any queries
+    vote_matrix = snapshot.vote_matrix
+
+    if len(selected_user_ids) != 0:
+        excluded_user_ids = [user_id for user_id in vote_matrix.member_ids if user_id not in selected_user_ids]
 
-        members = get_server_members(server_id)
-        if len(selected_user_ids) != 0:
-            excluded_user_ids = [member.user_id for member in members if member.user_id not in selected_user_ids]
+        filtered_games = filter_games_by_selected_users(games, selected_user_ids, excluded_user_ids, vote_matrix)
 
-            filtered_games = filter_games_by_selected_users(games, selected_user_ids, excluded_user_ids)
+        # Also filter out games that aren't released yet, as they can't be played at the moment
+        filtered_games = [game for game in filtered_games if game.release_state != ReleaseState.UNRELEASED]
 
-            # Also filter out games that aren't released yet, as they can't be played at the moment
-            filtered_games = [game for game in filtered_games if game.release_state != ReleaseState.UNRELEASED]
+        sorted_games = sort_games_by_score_and_selected_users(filtered_games, selected_user_ids, excluded_user_ids, vote_matrix)
+    else:
+        sorted_games = sort_games_by_score(games, vote_matrix)
+
+    games_list = []     # type: list[str]
+    for game, score in sorted_games:
+        game_text = f"{game.id} -"
+
+        # Add an emoji indicating how many players the game supports
+        if game.player_count:
+            player_count = min(4, game.player_count)
+            game_text += EMOJIS[f"{player_count}players"]
+        else:
+            game_text += EMOJIS["question"]
 
-            sorted_games = sort_games_by_score_and_selected_users(filtered_games, selected_user_ids, excluded_user_ids)
+        if game.steam_id is not None:
+            game_link = "https://store.steampowered.com/app/" + str(game.steam_id)
+            game_text += f" [{game.name}]({game_link})"
         else:
-            sorted_games = sort_games_by_score(games, len(members))
-
-        games_list = []     # type: list[str]
-        for game, score in sorted_games:
-            game_text = f"{game.id} -"
-
-            # Add an emoji indicating how many players the game supports
-            if game.player_count:
-                player_count = min(4, game.player_count)
-                game_text += EMOJIS[f"{player_count}players"]
-            else:
-                game_text += EMOJIS["question"]
-
-            if game.steam_id is not None:
-                game_link = "https://store.steampowered.com/app/" + str(game.steam_id)
-                game_text += f" [{game.name}]({game_link})"
-            else:
-                game_text += " " + game.name
-
-            # Add an asterisk if this game contains notes
-            if len(game.notes) > 0:
-                game_text += "\\*"
-
-            price_text = generate_price_text(game)
-            if price_text:
-                game_text += " " + price_text
-
-                if game.price_original != 0:
-                    # Check how many players still need to buy the game
-                    game_user_data_owned = (
-                        db_session.query(GameUserData)
-                            .filter(GameUserData.server_id == server_id)
-                            .filter(GameUserData.game_id == game.id)
-                            .filter(GameUserData.owned.is_(True))
-                            .all()
-                    )  # type: list[GameUserData]
-                    not_owned_count = len(members) - len(game_user_data_owned)
-                    if not_owned_count != 0:
-                        game_text += f" * {not_owned_count}"
-
-            games_list.append(game_text)
-
-        title_text = "Games list"
-        games_list_text = "\n".join(games_list)
-
-        list_embed = discord.Embed(
-            title=title_text,
-            description=games_list_text,
-            color=LIST_EMBED_COLOR
-        )
-        embeds = paginate_embed_description(list_embed)
-        return embeds
+            game_text += " " + game.name
+
+        # Add an asterisk if this game contains notes
+        if len(game.notes) > 0:
+            game_text += "\\*"
+
+        price_text = generate_price_text(game)
+        if price_text:
+            game_text += " " + price_text
+
+            if game.price_original != 0:
+                # Check how many players still need to buy the game
+                not_owned_count = vote_matrix.member_count - vote_matrix.count_owned(game.id)
+                if not_owned_count != 0:
+                    game_text += f" * {not_owned_count}"
+
+        games_list.append(game_text)
+
+    title_text = "Games list"
+    games_list_text = "\n".join(games_list)
+
+    list_embed = discord.Embed(
+        title=title_text,
+        description=games_list_text,
+        color=LIST_EMBED_COLOR
+    )
+    embeds = paginate_embed_description(list_embed)
+    return embeds
@@ -1,9 +1,9 @@
 import discord
 from discord.ext.commands import Bot
 from discord.ui import Select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import Session
 
-from database.db import db_session_scope
+from database.db import run_in_db_session
 from database.models import ServerMember, LiveMessage, LiveMessageType
 from embeds.page_buttons_view import PageButtonsView
 from shared.error_reporter import send_error_message
@@ -11,24 +11,16 @@ from shared.error_reporter import send_error_message
 
 class ListView(PageButtonsView):
 
-    def __init__(self, bot: Bot, embed_title: str, message_id: int, update_function: callable, server_id: int):
+    def __init__(self, bot: Bot, embed_title: str, message_id: int, update_function: callable, server_id: int, members: list[ServerMember]):
         super().__init__(bot=bot, embed_title=embed_title, message_id=message_id, update_function=update_function, server_id=server_id)
 
-        self.add_item(self.UserSelection(bot=bot, list_view_object=self))
+        self.add_item(self.UserSelection(bot=bot, list_view_object=self, members=members))
 
     class UserSelection(Select):
-        def __init__(self, bot: Bot, list_view_object):
+        def __init__(self, bot: Bot, list_view_object, members: list[ServerMember]):
             self.bot = bot
             self.list_view_object = list_view_object    # type: ListView
 
-            with db_session_scope() as db_session:
-                members = (
-                    db_session.query(ServerMember)
-                        .options(joinedload(ServerMember.user))  # Also preemptively retrieve User data
-                        .filter(ServerMember.server_id == self.list_view_object.server_id)
-                        .all()
-                )  # type: list[ServerMember]
-
             options = []
             for member in members:
                 user_text = member.user.global_name
@@ -42,7 +34,7 @@ class ListView(PageButtonsView):
             try:
                 selected_user_id = int(self.values[0])
 
-                with db_session_scope() as db_session:
+                def toggle_selected_user(db_session: Session) -> bool:
                     live_message = (
                         db_session.query(LiveMessage)
                             .filter(LiveMessage.server_id == self.list_view_object.server_id)
@@ -50,13 +42,17 @@ class ListView(PageButtonsView):
                             .first()
                     )  # type: LiveMessage
                     if live_message is None:
-                        await send_error_message(self.bot, f"Selected a user to play with for server {self.list_view_object.server_id}, but the server does not have a list object.")
-                        return True
+                        return False
 
                     if selected_user_id in live_message.selected_user_ids:
                         live_message.selected_user_ids.remove(selected_user_id)
                     else:
                         live_message.selected_user_ids.append(selected_user_id)
+                    return True
+
+                if not await run_in_db_session(toggle_selected_user):
+                    await send_error_message(self.bot, f"Selected a user to play with for server {self.list_view_object.server_id}, but the server does not have a list object.")
+                    return True
 
                 await self.list_view_object.update_function(self.bot, self.list_view_object.server_id, None)
 
@@ -1,11 +1,10 @@
 import discord
 from discord.ext.commands import Bot
 from discord.ui import View, Button
-from sqlalchemy.orm import Session
 
 from apis.discord import get_discord_user, get_discord_guild_object
-from database.db import db_session_scope
-from database.models import Game, GameUserData
+from database.db import run_in_db_session
+from database.utils import get_unvoted_games
 from embeds.edit_game import EditGame
 from shared.error_reporter import send_error_message
 
@@ -46,30 +45,6 @@ class UnvotedGames:
             self.add_item(Button(style=discord.ButtonStyle.blurple, label="Show all unvoted games", custom_id="send_all"))
             self.add_item(Button(style=discord.ButtonStyle.red, label="Close", custom_id="close"))
 
-        def get_unvoted_games(self, db_session: Session) -> list[Game]:
-            games = (
-                db_session.query(Game)
-                    .filter(Game.server_id == self.unvoted_games_object.server_id)
-                    .filter(Game.finished.is_(False))
-                    .all()
-            )  # type: list[Game]
-
-            unvoted_games = []
-            for game in games:
-                game_user_data_vote = (
-                    db_session.query(GameUserData)
-                        .filter(GameUserData.server_id == self.unvoted_games_object.server_id)
-                        .filter(GameUserData.user_id == self.unvoted_games_object.user_id)
-                        .filter(GameUserData.game_id == game.id)
-                        .filter(GameUserData.vote.isnot(None))
-                        .first()
-                )  # type: GameUserData
-
-                if game_user_data_vote is None:
-                    unvoted_games.append(game)
-
-            return unvoted_games
-
         async def interaction_check(self, interaction: discord.Interaction) -> bool:
             try:
                 await interaction.response.defer()
@@ -80,22 +55,21 @@ class UnvotedGames:
                     await self.unvoted_games_object.delete_message()
                     return True
 
-                with db_session_scope() as db_session:
-                    unvoted_games = self.get_unvoted_games(db_session)
-                    if len(unvoted_games) == 0:
-                        await interaction.followup.send("No unvoted games at the moment.", ephemeral=True)
-                        return True
+                unvoted_games = await run_in_db_session(get_unvoted_games, self.unvoted_games_object.server_id, self.unvoted_games_object.user_id)
+                if len(unvoted_games) == 0:
+                    await interaction.followup.send("No unvoted games at the moment.", ephemeral=True)
+                    return True
+
+                if button_id == "next":
+                    game = unvoted_games[0]
+                    edit_game = EditGame(self.bot, self.unvoted_games_object.server_id, game.id, interaction)
+                    await edit_game.send_message()
 
-                    if button_id == "next":
-                        game = unvoted_games[0]
+                elif button_id == "send_all":
+                    for game in unvoted_games:
                         edit_game = EditGame(self.bot, self.unvoted_games_object.server_id, game.id, interaction)
                         await edit_game.send_message()
 
-                    elif button_id == "send_all":
-                        for game in unvoted_games:
-                            edit_game = EditGame(self.bot, self.unvoted_games_object.server_id, game.id, interaction)
-                            await edit_game.send_message()
-
             except Exception as e:
                 await send_error_message(self.bot, e)
 
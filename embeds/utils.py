@@ -1,7 +1,6 @@
-from sqlalchemy.orm import joinedload
-
-from database.db import db_session_scope
-from database.models import Game, GameUserData, ServerMember, ReleaseState
+from database.models import Game, ReleaseState
+from database.server_cache import ServerSnapshot
+from shared.vote_matrix import VoteMatrix
 
 EMOJIS = {
     "owned": ":video_game:",
@@ -23,27 +22,20 @@ ALWAYS_WANT_TO_PLAY_RATING_THRESHOLD = 8    # or higher
 NEVER_WANT_TO_PLAY_RATING_THRESHOLD = 3     # or lower
 
 
-def sort_games_by_score(games: list[Game], member_count: int) -> list[tuple[Game, int]]:
+def sort_games_by_score(games: list[Game], vote_matrix: VoteMatrix) -> list[tuple[Game, int]]:
     game_scores = []
 
     for game in games:
         # Count the score for this game
-        with db_session_scope() as db_session:
-            game_user_data_list = (
-                db_session.query(GameUserData)
-                    .filter(GameUserData.server_id == game.server_id)
-                    .filter(GameUserData.game_id == game.id)
-                    .all()
-            )   # type: list[GameUserData]
-
-            if not game.finished:
-                votes = [data.vote for data in game_user_data_list if data.vote is not None]
-            else:
-                votes = [data.enjoyment_score for data in game_user_data_list if data.enjoyment_score is not None]
+        if not game.finished:
+            scores = vote_matrix.get_votes(game.id)
+        else:
+            scores = vote_matrix.get_enjoyment_scores(game.id)
+        votes = [score for score in scores if score is not None]
 
         total_score = sum(votes)
         # Use a score of 5 for the non-voters
-        non_voter_count = member_count - len(votes)
+        non_voter_count = vote_matrix.member_count - len(votes)
         total_score += non_voter_count * 5
 
         game_scores.append((game, total_score))
@@ -51,8 +43,10 @@ def sort_games_by_score(games: list[Game], member_count: int) -> list[tuple[Game
     return sorted(game_scores, key=lambda x: x[1], reverse=True)
 
 
-def filter_games_by_selected_users(games: list[Game], selected_user_ids: list[int], excluded_user_ids: list[int]) -> list[Game]:
+def filter_games_by_selected_users(games: list[Game], selected_user_ids: list[int], excluded_user_ids: list[int], vote_matrix: VoteMatrix) -> list[Game]:
     filtered_games = []
+    selected_columns = vote_matrix.get_columns(selected_user_ids)
+    excluded_columns = vote_matrix.get_columns(excluded_user_ids)
 
     for game in games:
         # Only show games that can be played with the amount of selected players
@@ -62,98 +56,64 @@ def filter_games_by_selected_users(games: list[Game], selected_user_ids: list[in
             # This game supports less players than desired, and can not be split evenly into multiple parties
             continue
 
-        with db_session_scope() as db_session:
-            game_user_data_list = (
-                db_session.query(GameUserData)
-                    .filter(GameUserData.server_id == game.server_id)
-                    .filter(GameUserData.game_id == game.id)
-                    .filter(GameUserData.vote.isnot(None))
-                    .all()
-            )  # type: list[GameUserData]
-
-            skip_game = False
-
-            # Check whether to skip a game based on someone (not) wanting to play it
-            for user_data in game_user_data_list:
-                # Skip this game if a selected user does not want to play it
-                if user_data.user_id in selected_user_ids and user_data.vote <= NEVER_WANT_TO_PLAY_RATING_THRESHOLD:
-                    skip_game = True
-                    break
-                # Skip this game if an excluded user really wants to play it
-                if user_data.user_id in excluded_user_ids and user_data.vote >= ALWAYS_WANT_TO_PLAY_RATING_THRESHOLD:
-                    skip_game = True
-                    break
-
-            if skip_game:
-                continue
-
-            filtered_games.append(game)
+        votes = vote_matrix.get_votes(game.id)
+
+        # Skip this game if a selected user does not want to play it
+        if any(votes[column] is not None and votes[column] <= NEVER_WANT_TO_PLAY_RATING_THRESHOLD for column in selected_columns):
+            continue
+        # Skip this game if an excluded user really wants to play it
+        if any(votes[column] is not None and votes[column] >= ALWAYS_WANT_TO_PLAY_RATING_THRESHOLD for column in excluded_columns):
+            continue
+
+        filtered_games.append(game)
 
     return filtered_games
 
 
-def sort_games_by_score_and_selected_users(games: list[Game], selected_user_ids: list[int], excluded_user_ids: list[int]) -> list[tuple[Game, int]]:
+def sort_games_by_score_and_selected_users(games: list[Game], selected_user_ids: list[int], excluded_user_ids: list[int], vote_matrix: VoteMatrix) -> list[tuple[Game, int]]:
     game_scores = []
     total_member_count = len(selected_user_ids) + len(excluded_user_ids)
     # A user's vote who is excluded weighs more heavily
     excluded_user_vote_weight = total_member_count
 
+    # Weigh each relevant column, in column order so the votes are summed in a consistent order
+    column_weights = {column: -excluded_user_vote_weight for column in vote_matrix.get_columns(excluded_user_ids)}
+    column_weights.update({column: 1 for column in vote_matrix.get_columns(selected_user_ids)})
+    weighted_columns = sorted(column_weights.items())
+    # Users without any data do not have a column, but still count as non-voters
+    unknown_selected_count = len(set(selected_user_ids) - set(vote_matrix.columns))
+    unknown_excluded_count = len(set(excluded_user_ids) - set(selected_user_ids) - set(vote_matrix.columns))
+
     for game in games:
-        with db_session_scope() as db_session:
-            game_user_data_votes = (
-                db_session.query(GameUserData)
-                    .filter(GameUserData.server_id == game.server_id)
-                    .filter(GameUserData.game_id == game.id)
-                    .filter(GameUserData.vote.isnot(None))
-                    .all()
-            )  # type: list[GameUserData]
-
-        voter_user_ids = set(user_data.user_id for user_data in game_user_data_votes)
-        non_voter_user_ids = set(selected_user_ids + excluded_user_ids) - voter_user_ids
+        votes = vote_matrix.get_votes(game.id)
 
         # Count the score for this game
         total_score = 0
-        for data in game_user_data_votes:
-            if data.user_id in selected_user_ids:
-                total_score += data.vote
-            elif data.user_id in excluded_user_ids:
-                total_score -= data.vote * excluded_user_vote_weight
+        non_voter_selected_count = unknown_selected_count
+        non_voter_excluded_count = unknown_excluded_count
+        for column, weight in weighted_columns:
+            vote = votes[column]
+            if vote is not None:
+                total_score += vote * weight
+            elif weight > 0:
+                non_voter_selected_count += 1
+            else:
+                non_voter_excluded_count += 1
 
         # Use a score of 5 for the non-voters
-        for user_id in non_voter_user_ids:
-            if user_id in selected_user_ids:
-                total_score += 5
-            elif user_id in excluded_user_ids:
-                total_score -= 5 * excluded_user_vote_weight
+        total_score += 5 * non_voter_selected_count
+        total_score -= 5 * excluded_user_vote_weight * non_voter_excluded_count
 
         game_scores.append((game, total_score))
 
     return sorted(game_scores, key=lambda x: x[1], reverse=True)
 
 
-def get_users_aliases_string(server_id: int, user_ids: list[int]) -> str:
-    with db_session_scope() as db_session:
-        # Get each user's alias, falling back to their global name if not set
-        users_text = ""
-        members = (
-            db_session.query(ServerMember)
-                .options(joinedload(ServerMember.user))     # Also preemptively retrieve User data
-                .filter(ServerMember.server_id == server_id)
-                .filter(ServerMember.user_id.in_(user_ids))
-                .all()
-        )   # type: list[ServerMember]
-
-        user_names = []
-        user_aliases = []
-        for member in members:
-            if member.alias is not None:
-                user_aliases.append(member.alias)
-            else:
-                user_names.append(member.user.global_name)
-
-        users_text += " ".join(user_aliases)
-        users_text += ", ".join(user_names)
-        return users_text
+def get_users_aliases_string(snapshot: ServerSnapshot, user_ids: list[int]) -> str:
+    # Get each user's alias, falling back to their global name if not set
+    user_ids = set(user_ids)
+    user_names = [name for user_id, name in snapshot.get_display_names().items() if user_id in user_ids]
+    return ", ".join(user_names)
 
 
 def generate_price_text(game: Game) -> str:
@@ -189,7 +149,7 @@ def generate_price_text(game: Game) -> str:
     return final_text
 
 
-def get_game_embed_field(game: Game):
+def get_game_embed_field(snapshot: ServerSnapshot, game: Game):
     """
     Gets the details of the given game from the dataset to be displayed in an embed field.
     Returns a dictionary with keys "name", "value", and "inline", as expected by Discord's embed field.
@@ -205,18 +165,12 @@ def get_game_embed_field(game: Game):
 
         description += f"\n> Price: {price_text}"
 
-    with db_session_scope() as db_session:
-        game_user_data_list = (
-            db_session.query(GameUserData)
-                .filter(GameUserData.server_id == game.server_id)
-                .filter(GameUserData.game_id == game.id)
-                .all()
-        )   # type: list[GameUserData]
+    vote_matrix = snapshot.vote_matrix
 
-    voted_user_ids = [data.user_id for data in game_user_data_list if data.vote is not None]
+    voted_user_ids = vote_matrix.get_voted_user_ids(game.id)
     if voted_user_ids:
         description += "\n> Voted: "
-        voters_text = get_users_aliases_string(game.server_id, voted_user_ids)
+        voters_text = get_users_aliases_string(snapshot, voted_user_ids)
         description += voters_text
 
     if game.player_count is not None:
@@ -225,24 +179,24 @@ def get_game_embed_field(game: Game):
         description += f"\n> Players: {player_count_text}"
 
     # Do not display who owns a game if the game is free, as you can't buy a free game
-    owned_user_data_list = [data for data in game_user_data_list if data.owned is not None]
-    if (owned_user_data_list or game.local) and game.price_original != 0:
+    owned_list = [owned for owned in vote_matrix.get_owned(game.id) if owned is not None]
+    if (owned_list or game.local) and game.price_original != 0:
         description += "\n> Owned: "
 
-        if owned_user_data_list:
-            owned_count = sum(1 for data in owned_user_data_list if data.owned)
+        if owned_list:
+            owned_count = sum(1 for owned in owned_list if owned)
             description += EMOJIS["owned"] * owned_count
-            description += EMOJIS["not_owned"] * (len(owned_user_data_list) - owned_count)
+            description += EMOJIS["not_owned"] * (len(owned_list) - owned_count)
 
         if game.local:
             description += "(" + EMOJIS["local"] + ")"
 
-    played_before_user_data_list = [data for data in game_user_data_list if data.played_before is not None]
-    if played_before_user_data_list:
+    played_before_list = [played_before for played_before in vote_matrix.get_played_before(game.id) if played_before is not None]
+    if played_before_list:
         description += "\n> Experience: "
-        played_before_count = sum(1 for data in played_before_user_data_list if data.played_before)
+        played_before_count = sum(1 for played_before in played_before_list if played_before)
         description += EMOJIS["experienced"] * played_before_count
-        description += EMOJIS["new"] * (len(played_before_user_data_list) - played_before_count)
+        description += EMOJIS["new"] * (len(played_before_list) - played_before_count)
 
     notes = game.notes
     if len(notes) > 0:
@@ -9,9 +9,14 @@ import datetime
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
 from apscheduler.triggers.cron import CronTrigger
 
+from apis.http_client import start_http_session, close_http_session
+from apis.igdb import backfill_igdb_multiplayer_info
 from apis.steam import update_database_steam_prices
+from apis.steam_catalog import update_steam_catalog
+from apis.steam_web import sync_steam_libraries
 from cogs.backlog import Backlog
 from cogs.games import Games
 from cogs.tools import Tools
@@ -20,11 +25,11 @@ from database.backup_service import create_backup
 from services.bedtime import load_bedtime_scheduler_jobs
 from shared import error_reporter
 from libraries import codenames
-from shared.exceptions import BotException
-from shared.live_messages import update_all_lists, load_list_views
+from shared.exceptions import BotException, ApiException
+from shared.live_messages import update_lists, load_list_views
 from shared.logger import log
 from services.free_games import check_free_to_keep_games
-from database.db import db_session_scope, update_db
+from database.db import run_in_db_session, update_db
 from database.models.server import Server
 from database.models.server_member import ServerMember
 from database.models.user import User
@@ -44,6 +49,9 @@ intents.members = True
 class DiscordBot(commands.Bot):
 
     async def setup_hook(self):
+        # Share one pool of HTTP connections between all APIs
+        await start_http_session()
+
         try:
             await self.add_cog(Backlog(self))
             await self.add_cog(Tools(self))
@@ -52,6 +60,10 @@ class DiscordBot(commands.Bot):
         except Exception as e:
             await send_error_message(e)
 
+    async def close(self):
+        await super().close()
+        await close_http_session()
+
 
 bot = DiscordBot(command_prefix="!", intents=intents)
 
@@ -61,8 +73,26 @@ async def send_error_message(exception):
 
 
 async def update_steam_prices() -> None:
-    await update_database_steam_prices()
-    await update_all_lists(bot)
+    # Only the lists of servers with changed prices have to be edited
+    changed_server_ids = await update_database_steam_prices()
+    await update_lists(bot, changed_server_ids)
+
+
+async def update_steam_app_catalog() -> None:
+    try:
+        await update_steam_catalog()
+    except ApiException as e:
+        await send_error_message(e)
+
+
+async def update_steam_libraries() -> None:
+    changed_server_ids = await sync_steam_libraries()
+    await update_lists(bot, changed_server_ids)
+
+
+async def backfill_multiplayer_info() -> None:
+    changed_server_ids = await backfill_igdb_multiplayer_info()
+    await update_lists(bot, changed_server_ids)
 
 
 @bot.event
@@ -85,6 +115,8 @@ async def on_ready():
     await update_steam_prices()
     # Check any free-to-keep games
     await check_free_to_keep_games(bot)
+    # Update the local Steam catalog that games are looked up in
+    await update_steam_app_catalog()
 
     codenames.load_games(bot)
 
@@ -93,6 +125,12 @@ async def on_ready():
 
     # Create a job to update the prices every 6 hours
     get_scheduler().add_job(update_steam_prices, CronTrigger(hour="0,6,12,18"), id="update_steam_prices", replace_existing=True)
+    # Create a job that updates the local Steam catalog every day
+    get_scheduler().add_job(update_steam_app_catalog, CronTrigger(hour="3"), id="update_steam_app_catalog", replace_existing=True)
+    # Create a job that refreshes which games the members with a linked Steam account own every day
+    get_scheduler().add_job(update_steam_libraries, CronTrigger(hour="5"), id="update_steam_libraries", replace_existing=True)
+    # Create a job that fills in missing multiplayer info from IGDB every day
+    get_scheduler().add_job(backfill_multiplayer_info, CronTrigger(hour="4"), id="backfill_multiplayer_info", replace_existing=True)
     # Create a job to check for new free-to-keep games every 6 hours
     get_scheduler().add_job(check_free_to_keep_games, CronTrigger(hour="7,19"), args=[bot], id="check_free_to_keep_games", replace_existing=True)
     # Create a job that makes a backup of the dataset every 12 hours
@@ -191,9 +229,10 @@ async def update_db_hook(ctx):
     if ctx.guild is None:
         return
 
-    with db_session_scope() as db_session:
+    server_id = ctx.guild.id
+
+    def ensure_known(db_session: Session):
         # Ensure this server is known in the database
-        server_id = ctx.guild.id
         server = db_session.get(Server, server_id)
         if server is None:
             server = Server(id=server_id)
@@ -228,6 +267,8 @@ async def update_db_hook(ctx):
             )
             db_session.add(member)
 
+    await run_in_db_session(ensure_known)
+
 
 if __name__ == "__main__":
     start_listening_to_updates(bot)
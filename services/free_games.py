@@ -1,35 +1,40 @@
 import discord
 from discord.ext.commands import Bot
+from sqlalchemy.orm import Session
 
 from apis.discord import get_discord_user
-from apis.free_games import get_free_to_keep_games
+from apis.free_games import update_free_to_keep_games
 from shared.error_reporter import send_error_message
-from database.db import db_session_scope
+from database.db import db_session_scope, run_in_db_session
 from database.models.free_game import FreeGame
 from database.models.free_game_subscriber import FreeGameSubscriber
 
 
 async def check_free_to_keep_games(bot: Bot):
     try:
-        with db_session_scope() as db_session:
-            # Get the deals that we've already gotten earlier
-            free_games_old = db_session.query(FreeGame).all()   # type: list[FreeGame]
-            free_games_old_ids = [free_game.deal_id for free_game in free_games_old]
+        new_deal_ids = await update_free_to_keep_games()
+        if len(new_deal_ids) == 0:
+            return
 
-        free_games = await get_free_to_keep_games(bot)
+        def get_new_free_games(db_session: Session) -> list[FreeGame]:
+            return (
+                db_session.query(FreeGame)
+                    .filter(FreeGame.deal_id.in_(new_deal_ids))
+                    .all()
+            )
+
+        # Send a message about each new deal to users who want to be notified
+        free_games = await run_in_db_session(get_new_free_games)
         for free_game in free_games:
-            # If this deal is new, send a message to users who want to be notified
-            if free_game.deal_id not in free_games_old_ids:
-                await notify_users_free_to_keep_game(bot, free_game)
+            await notify_users_free_to_keep_game(bot, free_game)
 
     except Exception as e:
         await send_error_message(bot, e)
 
 
 async def notify_users_free_to_keep_game(bot: Bot, free_game: FreeGame):
-    with db_session_scope() as db_session:
-        # Get the users that want to be notified of free games
-        subscribed_users = db_session.query(FreeGameSubscriber).all()  # type: list[FreeGameSubscriber]
+    # Get the users that want to be notified of free games
+    subscribed_users = await run_in_db_session(lambda db_session: db_session.query(FreeGameSubscriber).all())  # type: list[FreeGameSubscriber]
 
     for subscriber in subscribed_users:
         user = await get_discord_user(bot, subscriber.user_id)
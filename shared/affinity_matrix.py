@@ -0,0 +1,84 @@
+from typing import Optional
+
+from shared.vote_matrix import VoteMatrix
+
+# Pairs with a similarity of at least this percentage are grouped into the same cluster
+CLUSTER_SIMILARITY_THRESHOLD = 75.0
+
+
+class AffinityMatrix:
+    """
+    Holds how similarly each pair of members of a server votes, as a percentage based on the Mean Absolute Error
+    between their votes on the games they have both voted on.
+    """
+
+    def __init__(self, vote_matrix: VoteMatrix) -> None:
+        super().__init__()
+        self.member_ids = vote_matrix.member_ids
+        member_columns = [(user_id, vote_matrix.columns[user_id]) for user_id in self.member_ids]
+
+        # Sum the vote differences of every pair of members in a single pass over the games
+        difference_sums = {}    # type: dict[tuple[int, int], float]
+        shared_counts = {}      # type: dict[tuple[int, int], int]
+        for votes in vote_matrix.votes.values():
+            voted = [(user_id, votes[column]) for user_id, column in member_columns if votes[column] is not None]
+            for index, (user_id, vote) in enumerate(voted):
+                for other_user_id, other_vote in voted[index + 1:]:
+                    pair = (user_id, other_user_id)
+                    difference_sums[pair] = difference_sums.get(pair, 0) + abs(vote - other_vote)
+                    shared_counts[pair] = shared_counts.get(pair, 0) + 1
+
+        self.similarities = {}      # type: dict[tuple[int, int], float]
+        self.shared_counts = shared_counts
+        for pair, difference_sum in difference_sums.items():
+            # Convert the Mean Absolute Error to a percentage
+            mae = difference_sum / shared_counts[pair]
+            self.similarities[pair] = round((1 - (mae / 10)) * 100, 2)
+
+    def get_similarity(self, user_id: int, other_user_id: int) -> Optional[float]:
+        """
+        Returns None if the users have not voted on any of the same games.
+        """
+        pair = (user_id, other_user_id) if user_id < other_user_id else (other_user_id, user_id)
+        return self.similarities.get(pair)
+
+    def get_user_affinities(self, user_id: int) -> list[tuple[int, float]]:
+        """
+        Returns the similarity of the given user with every other member, ordered from most to least similar.
+        """
+        affinities = []
+        for other_user_id in self.member_ids:
+            if other_user_id == user_id:
+                continue
+            similarity = self.get_similarity(user_id, other_user_id)
+            if similarity is not None:
+                affinities.append((other_user_id, similarity))
+
+        return sorted(affinities, key=lambda x: x[1], reverse=True)
+
+    def get_top_pairs(self, limit: int) -> list[tuple[int, int, float]]:
+        pairs = [(user_id, other_user_id, similarity) for (user_id, other_user_id), similarity in self.similarities.items()]
+        return sorted(pairs, key=lambda x: (-x[2], -self.shared_counts[(x[0], x[1])]))[:limit]
+
+    def get_clusters(self, threshold: float = CLUSTER_SIMILARITY_THRESHOLD) -> list[list[int]]:
+        """
+        Groups members that are linked through pairs with at least the given similarity.
+        Members without any such pair are left out.
+        """
+        parents = {}    # type: dict[int, int]
+
+        def find(user_id: int) -> int:
+            while parents.setdefault(user_id, user_id) != user_id:
+                parents[user_id] = parents[parents[user_id]]
+                user_id = parents[user_id]
+            return user_id
+
+        for (user_id, other_user_id), similarity in self.similarities.items():
+            if similarity >= threshold:
+                parents[find(user_id)] = find(other_user_id)
+
+        clusters = {}   # type: dict[int, list[int]]
+        for user_id in sorted(parents):
+            clusters.setdefault(find(user_id), []).append(user_id)
+
+        return sorted(clusters.values(), key=len, reverse=True)
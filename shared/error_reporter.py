@@ -1,11 +1,31 @@
+import re
+import time
 import traceback
 
 from discord.ext.commands import Bot
 
 from apis.discord import get_discord_user
 from constants import MESSAGE_MAX_CHARACTERS, DEVELOPER_USER_ID
+from shared.exceptions import ApiException, ApiUnavailableException
 from shared.logger import log
 
+# Seconds during which the same API error is only sent once, so an outage does not flood the developer's DMs
+ERROR_REPEAT_INTERVAL = 60 * 60
+
+# Quoted values and numbers, like game IDs and names, which differ per request
+REQUEST_DETAILS_PATTERN = re.compile(r'"[^"]*"|\d+')
+
+# When each API error was last sent, and how many times it occurred since without being sent
+_sent_errors = {}   # type: dict[str, tuple[float, int]]
+
+
+def get_error_key(exception: ApiException) -> str:
+    if isinstance(exception, ApiUnavailableException):
+        # Every skipped request to the same API has the same cause
+        return f"Unavailable: {exception.host}"
+    # Leave out the details of the request, so the same failure for different games counts as the same error
+    return f"{type(exception).__name__}: {REQUEST_DETAILS_PATTERN.sub('#', str(exception))}"
+
 
 async def send_error_message(bot: Bot, exception):
     if isinstance(exception, Exception):
@@ -14,6 +34,18 @@ async def send_error_message(bot: Bot, exception):
         message = str(exception)
     log(message)
 
+    # Other errors are bugs, which should be reported every time
+    if isinstance(exception, ApiException):
+        key = get_error_key(exception)
+        now = time.time()
+        sent_at, unsent_count = _sent_errors.get(key, (None, 0))
+        if sent_at is not None and now - sent_at < ERROR_REPEAT_INTERVAL:
+            _sent_errors[key] = (sent_at, unsent_count + 1)
+            return
+        _sent_errors[key] = (now, 0)
+        if unsent_count > 0:
+            message += f"\n(Occurred {unsent_count} more times since it was last sent.)"
+
     developer = await get_discord_user(bot, DEVELOPER_USER_ID)
     for i in range(0, len(message), MESSAGE_MAX_CHARACTERS - 6):
         message_slice = message[i:i + MESSAGE_MAX_CHARACTERS - 6]
@@ -34,3 +34,14 @@ class InvalidChannelException(BotException):
 
 class ApiException(Exception):
     pass
+
+
+class ApiUnavailableException(ApiException):
+    """
+    Raised instead of sending a request to an API that keeps failing or that used up its request budget.
+    """
+
+    def __init__(self, host: str, reason: str):
+        super().__init__(f"Skipped request to {host}: {reason}")
+        self.host = host
+        self.reason = reason
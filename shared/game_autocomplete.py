@@ -3,16 +3,7 @@ from typing import Optional
 from discord import app_commands
 from discord.interactions import Interaction
 
-from database.db import db_session_scope
-from database.models import Game
-
-
-# Caches the list of games for each  server ID
-_game_cache: dict[int, list[Game]] = {}
-
-
-def clear_game_cache(server_id: int):
-    _game_cache.pop(server_id, None)
+from database.server_cache import load_server_snapshot
 
 
 def autocomplete_game(finished: Optional[bool] = None):
@@ -21,23 +12,8 @@ def autocomplete_game(finished: Optional[bool] = None):
         server_id = interaction.guild.id
         typed_text = typed_text.lower()
 
-        # Get the games cached for this server
-        games = _game_cache.get(server_id)
-
-        if games is None:
-            # Get and cache the games for this server
-            with db_session_scope() as db_session:
-                games = (
-                    db_session.query(Game)
-                        .filter(Game.server_id == server_id)
-                        .all()
-                )  # type: list[Game]
-
-            _game_cache[server_id] = games
-
-        # Check if we need to filter (un)finished games
-        if finished is not None:
-            games = [game for game in games if game.finished is finished]
+        # Get the games of this server, optionally only the (un)finished ones
+        games = (await load_server_snapshot(server_id)).get_games(finished)
 
         suggestions = []
         for game in games:
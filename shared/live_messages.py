@@ -1,11 +1,13 @@
-from typing import Optional
+from typing import Optional, Iterable
 
 import discord
 from discord.ext.commands import Bot
+from sqlalchemy.orm import Session
 
 from apis.discord import get_discord_guild_object
-from database.db import db_session_scope
-from database.models import LiveMessageType, LiveMessage, Server
+from database.db import run_in_db_session
+from database.models import LiveMessageType, LiveMessage
+from database.server_cache import load_server_snapshot
 from embeds.hall_of_game import generate_hog_embed
 from embeds.list import generate_list_embeds, generate_unvoted_embed, generate_filter_embed
 from embeds.utils import get_current_page_from_message_title
@@ -22,31 +24,31 @@ async def get_live_message_object(bot: Bot, server_id: int, message_type: LiveMe
     # Get the Discord guild object
     guild_object = await get_discord_guild_object(bot, server_id)
 
-    with db_session_scope() as db_session:
-        live_message = (
-            db_session.query(LiveMessage)
-                .filter(LiveMessage.server_id == server_id)
-                .filter(LiveMessage.message_type == message_type)
-                .first()
-        )   # type: LiveMessage
-        if live_message is None:
-            # This server does not have the specified message
-            return None
-
-        # Get the Discord channel object
-        channel_object = await guild_object.fetch_channel(live_message.channel_id)
-        if channel_object is None:
-            log(f"Discord could not find channel with ID {live_message.channel_id}. It has likely been deleted. Removing child message from the dataset...")
-            db_session.delete(live_message)
-            return None
-
-        # Get the Discord message object
-        try:
-            return await channel_object.fetch_message(live_message.message_id)
-        except discord.errors.NotFound:
-            log(f"Could not find {message_type} with ID {live_message.message_id}. It has likely been deleted. Removing it from the dataset...")
-            db_session.delete(live_message)
-            return None
+    live_message = (await load_server_snapshot(server_id)).get_live_message(message_type)
+    if live_message is None:
+        # This server does not have the specified message
+        return None
+
+    # Get the Discord channel object
+    channel_object = await guild_object.fetch_channel(live_message.channel_id)
+    if channel_object is None:
+        log(f"Discord could not find channel with ID {live_message.channel_id}. It has likely been deleted. Removing child message from the dataset...")
+        await run_in_db_session(delete_live_message, live_message.message_id)
+        return None
+
+    # Get the Discord message object
+    try:
+        return await channel_object.fetch_message(live_message.message_id)
+    except discord.errors.NotFound:
+        log(f"Could not find {message_type} with ID {live_message.message_id}. It has likely been deleted. Removing it from the dataset...")
+        await run_in_db_session(delete_live_message, live_message.message_id)
+        return None
+
+
+def delete_live_message(db_session: Session, message_id: int) -> None:
+    live_message = db_session.get(LiveMessage, str(message_id))     # type: LiveMessage
+    if live_message is not None:
+        db_session.delete(live_message)
 
 
 async def update_list(bot: Bot, server_id: int, page_number: int = None) -> None:
@@ -54,16 +56,11 @@ async def update_list(bot: Bot, server_id: int, page_number: int = None) -> None
     if list_message is None:
         return
 
-    with db_session_scope() as db_session:
-        live_message = (
-            db_session.query(LiveMessage)
-                .filter(LiveMessage.server_id == server_id)
-                .filter(LiveMessage.message_type == LiveMessageType.LIST)
-                .first()
-        )   # type: LiveMessage
-        if live_message is None:
-            await send_error_message(bot, "update_list() has a list_message Discord message but suddenly can't find it in the database.")
-            return None
+    snapshot = await load_server_snapshot(server_id)
+    live_message = snapshot.get_live_message(LiveMessageType.LIST)
+    if live_message is None:
+        await send_error_message(bot, "update_list() has a list_message Discord message but suddenly can't find it in the database.")
+        return None
 
     list_embeds = (await generate_list_embeds(server_id, live_message.selected_user_ids))
     if page_number is None:
@@ -74,14 +71,14 @@ async def update_list(bot: Bot, server_id: int, page_number: int = None) -> None
     try:
         if updated_list_embed is not None:
             embeds = [updated_list_embed]
-            filter_embed = generate_filter_embed(server_id)
+            filter_embed = await generate_filter_embed(server_id)
             if filter_embed is not None:
                 embeds.append(filter_embed)
-            unvoted_embed = generate_unvoted_embed(server_id)
+            unvoted_embed = await generate_unvoted_embed(server_id)
             if unvoted_embed is not None:
                 embeds.append(unvoted_embed)
 
-            list_view = ListView(bot, updated_list_embed.title, list_message.id, update_list, server_id)
+            list_view = ListView(bot, updated_list_embed.title, list_message.id, update_list, server_id, snapshot.members)
 
             await list_message.edit(embeds=embeds, view=list_view)
     except Exception as e:
@@ -107,23 +104,23 @@ async def update_live_messages(bot: Bot, server_id: int, skip_hog=False) -> None
         await update_hall_of_game(bot, server_id)
 
 
-async def update_all_lists(bot: Bot) -> None:
-    with db_session_scope() as db_session:
-        servers = db_session.query(Server).all()    # type: list[Server]
-
-        for server in servers:
-            await update_list(bot, server.id)
+async def update_lists(bot: Bot, server_ids: Iterable[int]) -> None:
+    for server_id in server_ids:
+        await update_list(bot, server_id)
 
 
 async def load_list_views(bot: Bot):
-    with db_session_scope() as db_session:
-        list_messages = (
+    def get_list_messages(db_session: Session) -> list[LiveMessage]:
+        return (
             db_session.query(LiveMessage)
                 .filter(LiveMessage.message_type == LiveMessageType.LIST)
                 .all()
-        )   # type: list[LiveMessage]
+        )
+
+    list_messages = await run_in_db_session(get_list_messages)
 
     for list_message in list_messages:
         list_message_obj = await get_live_message_object(bot, list_message.server_id, LiveMessageType.LIST)
         if list_message_obj is not None:
-            bot.add_view(ListView(bot, list_message_obj.embeds[0].title, list_message_obj.id, update_list, list_message.server_id))
+            members = (await load_server_snapshot(list_message.server_id)).members
+            bot.add_view(ListView(bot, list_message_obj.embeds[0].title, list_message_obj.id, update_list, list_message.server_id, members))
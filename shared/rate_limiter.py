@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Limits how often something can happen, allowing short bursts of up to "capacity" at once.
+    Tokens are refilled at "rate" per second, and every acquire takes one token, waiting for it if needed.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        super().__init__()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        # Waiters are served one at a time in order, so nobody gets starved
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
@@ -0,0 +1,68 @@
+from typing import Optional
+
+from database.models import GameUserData
+
+
+class VoteMatrix:
+    """
+    Holds the game user data of a server as a games x members matrix.
+    Each game ID maps to a row with one value per member column, where None means the member has not set that value.
+    """
+
+    def __init__(self, member_ids: list[int], game_user_data_list: list[GameUserData]) -> None:
+        super().__init__()
+        self.member_ids = sorted(member_ids)
+        # Users with data who are no longer a member still get a column, so their votes keep counting
+        column_user_ids = sorted(set(member_ids) | set(data.user_id for data in game_user_data_list))
+        self.columns = {user_id: column for column, user_id in enumerate(column_user_ids)}   # type: dict[int, int]
+        self.column_user_ids = column_user_ids
+
+        self.votes = {}             # type: dict[int, list[Optional[float]]]
+        self.enjoyment_scores = {}  # type: dict[int, list[Optional[float]]]
+        self.owned = {}             # type: dict[int, list[Optional[bool]]]
+        self.played_before = {}     # type: dict[int, list[Optional[bool]]]
+
+        for data in game_user_data_list:
+            column = self.columns[data.user_id]
+            self._get_row(self.votes, data.game_id)[column] = data.vote
+            self._get_row(self.enjoyment_scores, data.game_id)[column] = data.enjoyment_score
+            self._get_row(self.owned, data.game_id)[column] = data.owned
+            self._get_row(self.played_before, data.game_id)[column] = data.played_before
+
+        self._empty_row = [None] * len(self.column_user_ids)
+
+    def _get_row(self, values: dict[int, list], game_id: int) -> list:
+        row = values.get(game_id)
+        if row is None:
+            row = [None] * len(self.column_user_ids)
+            values[game_id] = row
+        return row
+
+    @property
+    def member_count(self) -> int:
+        return len(self.member_ids)
+
+    def get_columns(self, user_ids: list[int]) -> list[int]:
+        """
+        Returns the sorted column indices of the given users, skipping unknown users.
+        """
+        return sorted(self.columns[user_id] for user_id in set(user_ids) if user_id in self.columns)
+
+    def get_votes(self, game_id: int) -> list[Optional[float]]:
+        return self.votes.get(game_id, self._empty_row)
+
+    def get_enjoyment_scores(self, game_id: int) -> list[Optional[float]]:
+        return self.enjoyment_scores.get(game_id, self._empty_row)
+
+    def get_owned(self, game_id: int) -> list[Optional[bool]]:
+        return self.owned.get(game_id, self._empty_row)
+
+    def get_played_before(self, game_id: int) -> list[Optional[bool]]:
+        return self.played_before.get(game_id, self._empty_row)
+
+    def get_voted_user_ids(self, game_id: int) -> list[int]:
+        return [self.column_user_ids[column] for column, vote in enumerate(self.get_votes(game_id)) if vote is not None]
+
+    def count_owned(self, game_id: int) -> int:
+        return sum(1 for owned in self.get_owned(game_id) if owned is True)
+